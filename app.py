@@ -1,16 +1,20 @@
-import streamlit as st
-import asyncio
-from telethon import TelegramClient
-from telethon.sessions import StringSession
-from telethon.tl.types import Channel, Chat
-from telethon.tl.functions.channels import LeaveChannelRequest
-from telethon.tl.functions.messages import DeleteChatUserRequest
-from telethon.errors import PhoneCodeExpiredError, PhoneCodeInvalidError, SessionPasswordNeededError, FloodWaitError
 import os
-from dotenv import load_dotenv
+import tempfile
 
-# Load environment variables
-load_dotenv()
+import streamlit as st
+from exit_tool import (
+    DialogFilter, DialogIndex, TaskQueue, TitleIndex, account_key, metrics, read_snapshot, split_terms,
+    stream_target_groups, write_snapshot
+)
+from exit_tool.archive import archive_groups
+from exit_tool.auth import TelegramAuthenticator
+from exit_tool.client import ClientManager
+from exit_tool.enrich import GroupInfoCache, enrich_groups
+from exit_tool.index import ARCHIVE_FOLDER_ID
+from exit_tool.jobs import LeaveJournal, run_leave_job
+from exit_tool.leave import resolution_stats
+from exit_tool.sessions import SessionStore
+from exit_tool.snapshots import FORMATS
 
 # Configure Streamlit page
 st.set_page_config(
@@ -50,179 +54,58 @@ This tool helps you automatically leave Telegram groups containing specific keyw
 Please enter your Telegram API credentials and the keyword to get started.
 """)
 
-class TelegramAuthenticator:
-    def __init__(self, api_id, api_hash):
-        self.api_id = api_id
-        self.api_hash = api_hash
-        self.client = None
-        self.phone_code_hash = None
-        
-    async def start_auth(self, phone):
-        """Start authentication process and send verification code"""
-        try:
-            # Create client with StringSession and timeout
-            self.client = TelegramClient(
-                StringSession(), 
-                self.api_id, 
-                self.api_hash,
-                connection_retries=1,
-                retry_delay=1
-            )
-            
-            # Add timeout to prevent hanging
-            try:
-                await asyncio.wait_for(self.client.connect(), timeout=10.0)
-            except asyncio.TimeoutError:
-                return False, None, "Connection timeout - please check your internet connection"
-            
-            # Check if already authorized
-            try:
-                is_authorized = await asyncio.wait_for(
-                    self.client.is_user_authorized(), 
-                    timeout=5.0
-                )
-                if is_authorized:
-                    session_string = self.client.session.save()
-                    await self.client.disconnect()
-                    return True, session_string, "already_authorized"
-            except asyncio.TimeoutError:
-                await self.client.disconnect()
-                return False, None, "Authorization check timeout"
-            
-            # Send code request with timeout
-            try:
-                sent_code = await asyncio.wait_for(
-                    self.client.send_code_request(phone), 
-                    timeout=15.0
-                )
-                self.phone_code_hash = sent_code.phone_code_hash
-                
-                # Save the session state
-                session_string = self.client.session.save()
-                await self.client.disconnect()
-                return False, session_string, "code_sent"
-                
-            except asyncio.TimeoutError:
-                await self.client.disconnect()
-                return False, None, "Code request timeout - please try again"
-            except FloodWaitError as e:
-                await self.client.disconnect()
-                return False, None, f"Rate limited - please wait {e.seconds} seconds"
-            except Exception as e:
-                await self.client.disconnect()
-                error_msg = str(e).lower()
-                if "phone number" in error_msg:
-                    return False, None, "Invalid phone number format"
-                elif "flood" in error_msg:
-                    return False, None, "Too many attempts - please wait and try again"
-                else:
-                    return False, None, f"Failed to send code: {str(e)}"
-                    
-        except Exception as e:
-            try:
-                if self.client:
-                    await self.client.disconnect()
-            except:
-                pass
-            return False, None, f"Connection error: {str(e)}"
-    
-    async def verify_code(self, phone, code, session_string):
-        """Verify the code using the same session"""
-        try:
-            # Recreate client with the saved session
-            self.client = TelegramClient(
-                StringSession(session_string), 
-                self.api_id, 
-                self.api_hash,
-                connection_retries=1,
-                retry_delay=1
-            )
-            
-            try:
-                await asyncio.wait_for(self.client.connect(), timeout=10.0)
-            except asyncio.TimeoutError:
-                return False, None, "Connection timeout during verification"
-            
-            try:
-                # Use the stored phone_code_hash for verification
-                await asyncio.wait_for(
-                    self.client.sign_in(phone, code, phone_code_hash=self.phone_code_hash),
-                    timeout=10.0
-                )
-                
-                # Save the authenticated session
-                final_session = self.client.session.save()
-                await self.client.disconnect()
-                return True, final_session, "success"
-                
-            except asyncio.TimeoutError:
-                await self.client.disconnect()
-                return False, None, "Verification timeout - please try again"
-            except PhoneCodeExpiredError:
-                await self.client.disconnect()
-                return False, None, "code_expired"
-            except PhoneCodeInvalidError:
-                await self.client.disconnect()
-                return False, None, "invalid_code"
-            except SessionPasswordNeededError:
-                final_session = self.client.session.save()
-                await self.client.disconnect()
-                return False, final_session, "2fa_required"
-            except Exception as e:
-                await self.client.disconnect()
-                error_msg = str(e).lower()
-                if "password" in error_msg or "two-factor" in error_msg:
-                    final_session = self.client.session.save()
-                    return False, final_session, "2fa_required"
-                else:
-                    return False, None, f"Sign-in error: {str(e)}"
-                        
-        except Exception as e:
-            try:
-                if self.client:
-                    await self.client.disconnect()
-            except:
-                pass
-            return False, None, f"Verification error: {str(e)}"
-    
-    async def verify_2fa(self, password, session_string):
-        """Verify 2FA password"""
-        try:
-            self.client = TelegramClient(
-                StringSession(session_string), 
-                self.api_id, 
-                self.api_hash,
-                connection_retries=1,
-                retry_delay=1
-            )
-            
-            try:
-                await asyncio.wait_for(self.client.connect(), timeout=10.0)
-            except asyncio.TimeoutError:
-                return False, None, "Connection timeout during 2FA"
-            
-            try:
-                await asyncio.wait_for(
-                    self.client.sign_in(password=password),
-                    timeout=10.0
-                )
-                final_session = self.client.session.save()
-                await self.client.disconnect()
-                return True, final_session, "success"
-            except asyncio.TimeoutError:
-                await self.client.disconnect()
-                return False, None, "2FA timeout - please try again"
-            except Exception as e:
-                await self.client.disconnect()
-                return False, None, f"2FA error: {str(e)}"
-                    
-        except Exception as e:
-            try:
-                if self.client:
-                    await self.client.disconnect()
-            except:
-                pass
-            return False, None, f"2FA connection error: {str(e)}"
+@st.cache_resource
+def get_client_manager():
+    """Process-wide ClientManager that survives Streamlit reruns and is shared by sessions"""
+    return ClientManager()
+
+@st.cache_resource
+def get_session_store():
+    """Encrypted store of logged-in sessions, or None and the reason it is unavailable"""
+    try:
+        return SessionStore(), None
+    except RuntimeError as e:
+        return None, str(e)
+
+@st.cache_resource
+def get_task_queue():
+    """Worker pool shared by every session, so long operations never hold a script thread"""
+    return TaskQueue()
+
+def submit_task(iterable, name):
+    """Queue work on the shared worker pool under the logged-in account"""
+    return get_task_queue().submit(account_key(st.session_state.session_string), iterable, name)
+
+def show_queued(task):
+    """While task waits for a worker, show that (with a cancel button) and return True"""
+    if not task.queued:
+        return False
+    ahead = get_task_queue().position(task)
+    st.info("⏳ Waiting for a free worker" + (f" ({ahead} of your tasks ahead)" if ahead else "") + "…")
+    if st.button("✖️ Cancel", key=f"cancel_{task.name}"):
+        task.cancel()
+    return True
+
+@st.cache_resource(max_entries=32)
+def get_title_index(session_string, synced_at):
+    """TitleIndex over every indexed dialog, rebuilt whenever the dialog index is refreshed"""
+    return TitleIndex(DialogIndex.for_session(session_string).all())
+
+def snapshot_bytes(groups, format):
+    """Write groups to a snapshot of the given format and return the file's contents"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"snapshot.{format}")
+        write_snapshot([groups], path, format, account=account_key(st.session_state.session_string))
+        with open(path, "rb") as f:
+            return f.read()
+
+def load_snapshot(uploaded_file):
+    """Read an uploaded snapshot into DialogRecords, refusing snapshots of other accounts"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, os.path.basename(uploaded_file.name))
+        with open(path, "wb") as f:
+            f.write(uploaded_file.getvalue())
+        return list(read_snapshot(path, account=account_key(st.session_state.session_string)))
 
 # Initialize session state
 if 'client' not in st.session_state:
@@ -254,88 +137,19 @@ with st.sidebar:
     api_id = st.text_input("API ID", type="password", help="Enter your Telegram API ID")
     api_hash = st.text_input("API Hash", type="password", help="Enter your Telegram API Hash")
 
-@st.cache_data
-def get_target_groups_sync(api_id, api_hash, word, session_string=None):
-    """Synchronous wrapper for async function to work with Streamlit caching"""
-    async def _get_groups():
-        if session_string:
-            client = TelegramClient(StringSession(session_string), api_id, api_hash)
-        else:
-            client = TelegramClient(StringSession(), api_id, api_hash)
-        
-        async with client:
-            matches = []
-            try:
-                async for dlg in client.iter_dialogs():
-                    ent = dlg.entity
-                    title = getattr(ent, 'title', '') or ''
-                    if word.lower() in title.lower():
-                        # Store more comprehensive entity information
-                        entity_info = {
-                            'id': ent.id,
-                            'title': title,
-                            'type': type(ent).__name__,
-                            'access_hash': getattr(ent, 'access_hash', None),
-                            'username': getattr(ent, 'username', None)
-                        }
-                        matches.append(entity_info)
-            except Exception as e:
-                st.error(f"Error fetching groups: {str(e)}")
-            return matches
-    
-    return asyncio.run(_get_groups())
-
-async def leave_entity_by_info(client, entity_info):
-    """Leave entity using comprehensive entity information"""
-    try:
-        entity_id = entity_info['id']
-        entity_type = entity_info['type']
-        access_hash = entity_info['access_hash']
-        username = entity_info['username']
-        
-        # Try different methods to get the entity
-        entity = None
-        
-        # Method 1: Try by username if available
-        if username:
-            try:
-                entity = await client.get_entity(username)
-            except:
-                pass
-        
-        # Method 2: Try by ID with access_hash if available
-        if not entity and access_hash:
-            try:
-                if entity_type == 'Channel':
-                    from telethon.tl.types import PeerChannel
-                    entity = await client.get_entity(PeerChannel(entity_id))
-                elif entity_type == 'Chat':
-                    from telethon.tl.types import PeerChat
-                    entity = await client.get_entity(PeerChat(entity_id))
-            except:
-                pass
-        
-        # Method 3: Try by just ID as fallback
-        if not entity:
-            try:
-                entity = await client.get_entity(entity_id)
-            except:
-                pass
-        
-        if not entity:
-            raise Exception(f"Could not resolve entity: {entity_info['title']}")
-        
-        # Leave the entity
-        if entity_type == 'Channel':
-            await client(LeaveChannelRequest(entity))
-        elif entity_type == 'Chat':
-            await client(DeleteChatUserRequest(entity.id, 'me'))
-        
-        return True
-        
-    except Exception as e:
-        st.error(f"Error leaving {entity_info['title']}: {str(e)}")
-        return False
+def complete_login(session_string, phone):
+    """Finish logging in: hand the connection to the shared manager and save the session if asked"""
+    st.session_state.logged_in = True
+    st.session_state.session_string = session_string
+    st.session_state.phone = phone
+    get_client_manager().adopt(
+        int(api_id), api_hash, session_string, st.session_state.authenticator.release_client()
+    )
+    # The passphrase is only kept in memory for the length of the login flow
+    passphrase = st.session_state.pop('login_passphrase', None)
+    store, _ = get_session_store()
+    if store is not None and passphrase:
+        store.save(phone, passphrase, session_string)
 
 def main():
     if not api_id or not api_hash:
@@ -352,10 +166,29 @@ def main():
         
         if not st.session_state.phone_entered:
             phone = st.text_input("Enter your phone number (with country code, e.g., +1234567890):")
+            store, store_unavailable = get_session_store()
+            passphrase = ""
+            remember = False
+            if store is None:
+                st.caption(f"Saved logins are unavailable: {store_unavailable}")
+            else:
+                # Only the passphrase decrypts a saved login, so knowing a phone number is not enough
+                passphrase = st.text_input(
+                    "Saved-login passphrase (optional):", type="password",
+                    help="Restores a login saved with this passphrase without a code; leave empty to log in with a code"
+                )
+                remember = st.checkbox("Remember this login on this server with this passphrase")
+            passphrase_too_short = remember and len(passphrase) < SessionStore.MIN_PASSPHRASE_LENGTH
+            if passphrase_too_short:
+                st.warning(
+                    f"Choose a passphrase of at least {SessionStore.MIN_PASSPHRASE_LENGTH} characters to remember the login."
+                )
             
             col1, col2 = st.columns([3, 1])
             with col1:
-                send_code_btn = st.button("Send Verification Code", type="primary", disabled=not phone)
+                send_code_btn = st.button(
+                    "Send Verification Code", type="primary", disabled=not phone or passphrase_too_short
+                )
             with col2:
                 if st.button("❌ Cancel") and 'sending_code' in st.session_state:
                     if 'sending_code' in st.session_state:
@@ -374,9 +207,11 @@ def main():
                     progress_bar.progress(25)
                     
                     try:
-                        # Run authentication with progress updates
-                        success, session_result, status = asyncio.run(
-                            st.session_state.authenticator.start_auth(phone)
+                        # A saved session skips the code flow unless it was revoked
+                        saved_session = store.load(phone, passphrase) if store is not None else None
+                        st.session_state.login_passphrase = passphrase if remember else None
+                        success, session_result, status = get_client_manager().run_coroutine(
+                            st.session_state.authenticator.start_auth(phone, saved_session)
                         )
                         
                         progress_bar.progress(100)
@@ -388,10 +223,12 @@ def main():
                         if 'sending_code' in st.session_state:
                             del st.session_state.sending_code
                         
+                        if st.session_state.authenticator.revoked_session:
+                            store.delete(phone)
+                            st.session_state.saved_login_revoked = True
                         if status == "already_authorized":
-                            st.session_state.logged_in = True
-                            st.session_state.session_string = session_result
-                            st.success("Already authenticated!")
+                            complete_login(session_result, phone)
+                            st.success("Restored saved login!" if saved_session else "Already authenticated!")
                             st.rerun()
                         elif status == "code_sent":
                             st.session_state.phone_entered = True
@@ -418,8 +255,12 @@ def main():
                     st.rerun()
         
         elif st.session_state.code_sent and not st.session_state.get('requires_2fa', False):
+            if st.session_state.get('saved_login_revoked'):
+                st.info("Your saved login was revoked (e.g. from another device), so a new code is needed.")
             st.info("📱 Enter the verification code from your Telegram app")
             st.warning("⚡ IMPORTANT: Enter the code within 2-3 minutes!")
+            for line in st.session_state.authenticator.timing_summary():
+                st.caption(line)
             
             col1, col2 = st.columns([3, 1])
             
@@ -436,7 +277,7 @@ def main():
                     # Reset and get a new code
                     with st.spinner("Sending new code..."):
                         try:
-                            success, session_result, status = asyncio.run(
+                            success, session_result, status = get_client_manager().run_coroutine(
                                 st.session_state.authenticator.start_auth(st.session_state.phone)
                             )
                             if status == "code_sent":
@@ -454,7 +295,7 @@ def main():
                 else:
                     with st.spinner("Verifying code..."):
                         try:
-                            success, session_result, status = asyncio.run(
+                            success, session_result, status = get_client_manager().run_coroutine(
                                 st.session_state.authenticator.verify_code(
                                     st.session_state.phone, 
                                     verification_code,
@@ -463,8 +304,7 @@ def main():
                             )
                             
                             if success:
-                                st.session_state.logged_in = True
-                                st.session_state.session_string = session_result
+                                complete_login(session_result, st.session_state.phone)
                                 st.success("🎉 Authentication successful!")
                                 st.rerun()
                             elif status == "2fa_required":
@@ -483,19 +323,23 @@ def main():
             
             # Reset option
             if st.button("🔙 Use Different Phone Number"):
-                for key in ['phone_entered', 'code_sent', 'phone', 'temp_session', 'requires_2fa']:
+                get_client_manager().run_coroutine(st.session_state.authenticator.disconnect())
+                for key in ['phone_entered', 'code_sent', 'phone', 'temp_session', 'requires_2fa', 'saved_login_revoked',
+                            'login_passphrase']:
                     if key in st.session_state:
                         del st.session_state[key]
                 st.rerun()
         
         elif st.session_state.get('requires_2fa', False):
             st.info("🔒 Your account has Two-Factor Authentication enabled")
+            for line in st.session_state.authenticator.timing_summary():
+                st.caption(line)
             password = st.text_input("2FA Password:", type="password", help="Your Telegram 2FA password")
             
             if st.button("Verify 2FA", type="primary") and password:
                 with st.spinner("Verifying 2FA password..."):
                     try:
-                        success, session_result, status = asyncio.run(
+                        success, session_result, status = get_client_manager().run_coroutine(
                             st.session_state.authenticator.verify_2fa(
                                 password,
                                 st.session_state.temp_session
@@ -503,8 +347,7 @@ def main():
                         )
                         
                         if success:
-                            st.session_state.logged_in = True
-                            st.session_state.session_string = session_result
+                            complete_login(session_result, st.session_state.phone)
                             st.success("🎉 2FA verification successful!")
                             st.rerun()
                         else:
@@ -516,75 +359,552 @@ def main():
     if st.session_state.logged_in:
         st.success("✅ Successfully authenticated!")
         
-        keyword = st.text_input("Enter the keyword to search for in group titles:", 
-                              help="Groups containing this keyword will be listed for removal")
+        # Searches and leave runs happen on background threads; only their progress fragments poll them
+        if st.session_state.get('leave_task'):
+            leave_progress()
+            return
+        if st.session_state.get('archive_task'):
+            archive_progress()
+            return
+        if st.session_state.get('enrich_task'):
+            enrich_progress()
+            return
+        show_leave_result()
+        show_archive_result(api_id, api_hash)
+        show_unfinished_jobs(api_id, api_hash)
+        if st.session_state.get('search_task'):
+            search_progress()
+            return
+        groups_panel(api_id, api_hash)
+
+@st.fragment
+def groups_panel(api_id, api_hash):
+    """Search form, results and leave confirmation; using them only reruns this panel"""
+    keyword_text = st.text_area("Enter the keywords to search for in group titles:", 
+                          help="One keyword per line (or comma-separated). Groups containing any of them will be listed for removal")
+    keywords = split_terms(keyword_text)
+    
+    with st.expander("Advanced matching"):
+        pattern_text = st.text_area("Regular expressions (one per line):",
+                                    help="Case-insensitive, matched anywhere in the title")
+        exclude_text = st.text_area("Exclude titles containing:",
+                                    help="One term per line (or comma-separated). Matching groups are never listed")
+        normalize = st.checkbox(
+            "Unicode-aware matching", value=True,
+            help="Also match look-alike letters, fullwidth/styled text and emoji-padded titles"
+        )
+    patterns = [p.strip() for p in pattern_text.splitlines() if p.strip()]
+    exclude = split_terms(exclude_text)
+    
+    with st.expander("Filter dialogs"):
+        kinds = st.multiselect(
+            "Only these kinds:", options=DialogFilter.KINDS,
+            format_func=lambda kind: {'megagroup': "Groups", 'broadcast': "Channels", 'chat': "Basic groups"}[kind],
+            help="Leave empty to search every kind"
+        )
+        archive = st.radio("Archived chats:", ["Include", "Exclude", "Only archived"], horizontal=True)
+        inactive_days = st.number_input(
+            "Only dialogs inactive for at least this many days (0 = any):", min_value=0, value=0, step=30
+        )
+    dialog_filter = DialogFilter(
+        kinds, {"Include": None, "Exclude": False, "Only archived": True}[archive], inactive_days or None
+    )
+    
+    full_refresh = st.checkbox(
+        "Re-download full dialog list",
+        help="Searches normally use the local dialog index and only fetch new dialogs from Telegram"
+    )
+    
+    index = DialogIndex.for_session(st.session_state.get('session_string'))
+    if index.synced_at:
+        with st.expander("⚡ Instant title lookup"):
+            lookup = st.text_input("Find groups by title:",
+                                   help="Searches all downloaded dialogs, ignoring case, look-alike letters and emoji")
+            typos = st.slider("Allowed typos:", min_value=0, max_value=2, value=0)
+            if lookup:
+                title_index = get_title_index(st.session_state.get('session_string'), index.synced_at)
+                lookup_results = title_index.search(lookup, max_distance=typos, limit=200)
+                st.caption(f"{len(lookup_results)} of {len(title_index)} dialogs")
+                if typos > title_index.max_typos(lookup):
+                    st.caption(f"Only {title_index.max_typos(lookup)} typo(s) allowed for a query this short")
+                st.dataframe([{'Title': g.title, 'Type': g.type} for g in lookup_results])
+                if lookup_results and st.button("Select these groups"):
+                    st.session_state.found_groups = [g.with_rules((f"lookup: {lookup}",)) for g in lookup_results]
+                    st.session_state.search_complete = True
+                    st.rerun(scope="fragment")
+    
+    with st.expander("📥 Load a snapshot"):
+        uploaded = st.file_uploader(
+            "Snapshot file:", type=['csv', 'jsonl', 'ndjson', 'parquet', 'arrow', 'feather', 'ipc'],
+            help="A snapshot exported earlier for this account, to use as the selection without searching again"
+        )
+        if uploaded is not None and st.button("Use this snapshot"):
+            try:
+                st.session_state.found_groups = load_snapshot(uploaded)
+                st.session_state.search_complete = True
+                st.rerun(scope="fragment")
+            except Exception as e:
+                st.error(f"Could not load snapshot: {str(e)}")
+    
+    max_matches = st.number_input(
+        "Stop after this many matches (0 = no limit):", min_value=0, value=0, step=10
+    )
+    
+    if keywords or patterns:
+        if st.button("🔍 Search Groups"):
+            # Matches are collected on a background thread, so stopping keeps what was found so far
+            st.session_state.found_groups = []
+            st.session_state.search_complete = False
+            st.session_state.search_task = submit_task(
+                stream_target_groups(
+                    int(api_id), api_hash, keywords, st.session_state.get('session_string'),
+                    force_refresh=full_refresh, patterns=patterns, exclude=exclude,
+                    manager=get_client_manager(), max_matches=max_matches or None, normalize=normalize,
+                    dialog_filter=dialog_filter
+                ),
+                "search"
+            )
+            st.rerun()
         
-        if keyword:
-            if st.button("🔍 Search Groups"):
-                with st.spinner("Searching for matching groups..."):
-                    try:
-                        groups = get_target_groups_sync(
-                            int(api_id), api_hash, keyword, st.session_state.get('session_string')
-                        )
-                        
-                        if not groups:
-                            st.info("No groups found matching your keyword.")
-                            return
-                        
-                        st.session_state.found_groups = groups
-                        st.rerun()
-                    except Exception as e:
-                        st.error(f"Error searching groups: {str(e)}")
+    if st.session_state.get('search_error'):
+        st.error(f"Error searching groups: {st.session_state.pop('search_error')}")
+    elif st.session_state.get('search_complete') and not st.session_state.get('found_groups'):
+        st.info("No groups found matching your keywords.")
+    
+    if st.session_state.get('found_groups') and not st.session_state.get('search_complete', True):
+        st.info(f"Search was stopped early - showing the {len(st.session_state.found_groups)} groups found so far.")
+    
+    # Display found groups
+    if 'found_groups' in st.session_state and st.session_state.found_groups:
+        st.write("### 📋 Found Groups:")
+        found_groups = st.session_state.found_groups
+        # Cached details cost no requests; missing ones are fetched on demand in the background
+        group_info = GroupInfoCache.for_session(st.session_state.session_string).get_many(found_groups)
+        missing = len(found_groups) - len(group_info)
+        if missing and st.button(f"🔎 Fetch member counts and admin status ({missing} groups)"):
+            start_enrich(api_id, api_hash, found_groups)
+            st.rerun()
+        
+        shown_groups = found_groups
+        if group_info:
+            shown_groups = filter_and_sort_groups(found_groups, group_info)
+        
+        # Records are the options themselves; labels are built (once) only when displayed
+        selected_groups = st.multiselect(
+            "Select groups to leave:",
+            options=shown_groups,
+            default=shown_groups,
+            format_func=lambda group: info_label(group, group_info.get(group.key))
+        )
+        
+        with st.expander("📤 Export found groups"):
+            export_format = st.selectbox("Format:", FORMATS)
+            # Written only on request and kept until the results or the format change, so
+            # reruns of this fragment never rewrite a large selection to disk
+            prepared = st.session_state.get('prepared_export')
+            if prepared and (prepared['groups'] is not found_groups or prepared['format'] != export_format):
+                prepared = st.session_state.prepared_export = None
+            if prepared is None and st.button("Prepare export"):
+                try:
+                    prepared = st.session_state.prepared_export = {
+                        'groups': found_groups, 'format': export_format,
+                        'data': snapshot_bytes(found_groups, export_format)
+                    }
+                except RuntimeError as e:
+                    st.error(str(e))
+            if prepared is not None:
+                st.download_button("Download snapshot", prepared['data'], file_name=f"groups.{export_format}")
+        
+        if selected_groups:
+            if st.button("🗄️ Archive & Mute Selected Groups",
+                         help="Moves the groups to the archive and mutes them, in batches. This can be undone"):
+                start_archive(api_id, api_hash, selected_groups)
+                del st.session_state.found_groups
+                st.rerun()
             
-            # Display found groups
-            if 'found_groups' in st.session_state and st.session_state.found_groups:
-                st.write("### 📋 Found Groups:")
-                group_options = {f"{group['title']} ({group['type']})": group 
-                               for group in st.session_state.found_groups}
-                
-                selected_groups = st.multiselect(
-                    "Select groups to leave:",
-                    options=list(group_options.keys()),
-                    default=list(group_options.keys())
-                )
-                
-                if selected_groups:
-                    st.warning(f"⚠️ You are about to leave {len(selected_groups)} group(s). This action cannot be undone.")
-                    confirm = st.checkbox("I confirm that I want to leave these groups")
-                    
-                    if confirm and st.button("🚪 Leave Selected Groups", type="primary"):
-                        progress_bar = st.progress(0)
-                        success_count = 0
-                        
-                        async def leave_groups():
-                            nonlocal success_count
-                            client = TelegramClient(StringSession(st.session_state.session_string), int(api_id), api_hash)
-                            
-                            async with client:
-                                for i, group_name in enumerate(selected_groups):
-                                    entity_info = group_options[group_name]
-                                    success = await leave_entity_by_info(client, entity_info)
-                                    if success:
-                                        success_count += 1
-                                    progress_bar.progress((i + 1) / len(selected_groups))
-                                    await asyncio.sleep(1.5)  # Rate limiting
-                        
-                        try:
-                            asyncio.run(leave_groups())
-                            st.success(f"✅ Successfully left {success_count}/{len(selected_groups)} groups!")
-                            # Clear the found groups to start fresh
-                            if 'found_groups' in st.session_state:
-                                del st.session_state.found_groups
-                        except Exception as e:
-                            st.error(f"Error during group leaving process: {str(e)}")
+            st.warning(f"⚠️ You are about to leave {len(selected_groups)} group(s). This action cannot be undone.")
+            confirm = st.checkbox("I confirm that I want to leave these groups")
+            
+            if confirm and st.button("🚪 Leave Selected Groups", type="primary"):
+                # The job is journaled first, so an interrupted run can be resumed later
+                journal = LeaveJournal.for_session(st.session_state.session_string)
+                start_leave(api_id, api_hash, journal.create_job(selected_groups))
+                # Clear the found groups to start fresh
+                del st.session_state.found_groups
+                st.rerun()
+
+def info_label(group, info):
+    """Multiselect label for a group, with its member count and admin status when known"""
+    if info is None:
+        return group.label
+    details = [f"{info.members} members" if info.members is not None else "? members"]
+    if info.is_admin:
+        details.append("admin")
+    if info.is_forum:
+        details.append("forum")
+    if info.linked_chat_id:
+        details.append("has discussion")
+    return f"{group.label} · {', '.join(details)}"
+
+def filter_and_sort_groups(groups, group_info):
+    """Filter and sort controls over fetched group details; groups without details are kept unless filtered"""
+    with st.expander("Filter and sort results"):
+        col1, col2 = st.columns(2)
+        with col1:
+            min_members = st.number_input("Minimum members:", min_value=0, value=0, step=100)
+        with col2:
+            max_members = st.number_input("Maximum members (0 = no limit):", min_value=0, value=0, step=100)
+        hide_admin = st.checkbox("Hide groups I own or administer", value=True)
+        only_forums = st.checkbox("Only forums")
+        only_linked = st.checkbox("Only groups/channels with a linked discussion")
+        sort_by = st.selectbox(
+            "Sort by:", ["Most recent activity", "Members (most first)", "Members (fewest first)", "Title"]
+        )
+    
+    def keep(group):
+        info = group_info.get(group.key)
+        if info is None:
+            return not (min_members or max_members or only_forums or only_linked)
+        members = info.members or 0
+        if members < min_members or (max_members and members > max_members):
+            return False
+        if hide_admin and info.is_admin:
+            return False
+        if only_forums and not info.is_forum:
+            return False
+        if only_linked and not info.linked_chat_id:
+            return False
+        return True
+    
+    def members(group):
+        info = group_info.get(group.key)
+        return info.members if info is not None and info.members is not None else -1
+    
+    shown = [group for group in groups if keep(group)]
+    if sort_by == "Members (most first)":
+        shown.sort(key=members, reverse=True)
+    elif sort_by == "Members (fewest first)":
+        shown.sort(key=members)
+    elif sort_by == "Title":
+        shown.sort(key=lambda group: group.title.casefold())
+    else:
+        shown.sort(key=lambda group: group.date, reverse=True)
+    if len(shown) < len(groups):
+        st.caption(f"Showing {len(shown)} of {len(groups)} groups")
+    return shown
+
+def start_enrich(api_id, api_hash, groups):
+    """Fetch full info for groups in the background, filling the per-account cache"""
+    session_string = st.session_state.session_string
+    cache = GroupInfoCache.for_session(session_string)
+    st.session_state.enrich_task = submit_task(
+        get_client_manager().stream(
+            int(api_id), api_hash, session_string, lambda client: enrich_groups(client, groups, cache)
+        ),
+        "enrich"
+    )
+    st.session_state.enrich_total = len(groups)
+
+@st.fragment(run_every=1.0)
+def enrich_progress():
+    """Poll the running enrichment; only this fragment reruns until it finishes"""
+    task = st.session_state.enrich_task
+    if show_queued(task):
+        return
+    total = st.session_state.enrich_total
+    results = list(task.items)
+    errors = [(record.title, error) for record, _, error in results if error]
+    st.progress(
+        len(results) / total if total else 1.0,
+        text=f"Fetched details for {len(results) - len(errors)}/{total} groups · {len(errors)} failed · "
+             f"{task.elapsed:.0f}s"
+    )
+    
+    if not task.done:
+        if st.button("🛑 Stop fetching", help="Keeps the details fetched so far"):
+            task.cancel()
+        return
+    
+    del st.session_state.enrich_task
+    if task.error:
+        st.session_state.search_error = str(task.error)
+    st.rerun()
 
-# Logout functionality
-if st.sidebar.button("🚪 Logout", key="logout"):
-    for key in ['client', 'logged_in', 'phone_entered', 'code_sent', 'phone', 'phone_code_hash', 'session_string', 'found_groups', 'requires_2fa', 'authenticator', 'temp_session']:
+@st.fragment(run_every=1.0)
+def search_progress():
+    """Poll the running search; only this fragment reruns until the search finishes"""
+    task = st.session_state.search_task
+    if show_queued(task):
+        return
+    results = list(task.items)
+    found = [group for _, matches in results for group in matches]
+    scanned = results[-1][0] if results else 0
+    st.text(f"🔎 Scanned {scanned} dialogs · {len(found)} matching groups · {task.elapsed:.0f}s")
+    if found:
+        st.dataframe([{'Title': g.title, 'Type': g.type, 'Matched': ', '.join(g.matched_rules)} for g in found])
+    
+    if not task.done:
+        if st.button("🛑 Stop Search", help="Stops scanning and keeps the groups found so far"):
+            task.cancel()
+        return
+    
+    del st.session_state.search_task
+    st.session_state.found_groups = found
+    st.session_state.search_complete = not task.cancelled
+    if task.error:
+        st.session_state.search_error = str(task.error)
+    st.rerun()
+
+@st.cache_resource
+def get_leave_tasks():
+    """Leave runs by (session, job id), shared by every browser tab of this server"""
+    return {}
+
+def _leave_and_unindex(manager, api_id, api_hash, session_string, job_id, retry_failed):
+    """Run the rest of a leave job, dropping left groups from the dialog index when it ends"""
+    journal = LeaveJournal.for_session(session_string)
+    left_groups = []
+    try:
+        results = manager.stream(
+            api_id, api_hash, session_string,
+            lambda client: run_leave_job(client, journal, job_id, retry_failed=retry_failed)
+        )
+        for entity_info, error in results:
+            if not error:
+                left_groups.append(entity_info)
+            yield entity_info, error
+    finally:
+        DialogIndex.for_session(session_string).remove(left_groups)
+
+def start_leave(api_id, api_hash, job_id, retry_failed=False):
+    """Run a journaled leave job in the background, or watch it if it is already running"""
+    session_string = st.session_state.session_string
+    tasks = get_leave_tasks()
+    task = tasks.get((session_string, job_id))
+    if task is None or task.done:
+        task = tasks[(session_string, job_id)] = submit_task(
+            _leave_and_unindex(get_client_manager(), int(api_id), api_hash, session_string, job_id, retry_failed),
+            f"leave-{job_id}"
+        )
+    st.session_state.leave_task = task
+    st.session_state.leave_job = job_id
+
+@st.fragment(run_every=1.0)
+def leave_progress():
+    """Poll the running leave job; only this fragment reruns until it finishes"""
+    task = st.session_state.leave_task
+    if show_queued(task):
+        return
+    job_id = st.session_state.leave_job
+    status = LeaveJournal.for_session(st.session_state.session_string).status(job_id)
+    finished = status['left'] + status['failed']
+    st.progress(
+        finished / status['total'] if status['total'] else 1.0,
+        text=f"Job #{job_id}: {status['left']} left · {status['failed']} failed · "
+             f"{status['total'] - finished} remaining · {task.elapsed:.0f}s"
+    )
+    errors = [(info.title, error) for info, error in list(task.items) if error]
+    for title, error in errors:
+        st.error(f"Error leaving {title}: {error}")
+    
+    if not task.done:
+        if st.button("⏸️ Pause", help="Stops after the groups in progress; the job can be resumed later"):
+            task.cancel()
+        return
+    
+    del st.session_state.leave_task
+    get_leave_tasks().pop((st.session_state.session_string, job_id), None)
+    st.session_state.leave_result = {
+        'status': status, 'errors': errors, 'error': str(task.error) if task.error else None
+    }
+    st.rerun()
+
+def show_leave_result():
+    """Report the outcome of the last leave run once"""
+    result = st.session_state.pop('leave_result', None)
+    if result is None:
+        return
+    for title, error in result['errors']:
+        st.error(f"Error leaving {title}: {error}")
+    if result['error']:
+        st.error(f"Error during group leaving process: {result['error']}")
+    status = result['status']
+    if status['pending'] + status['resolved']:
+        st.info(f"⏸️ Stopped after leaving {status['left']}/{status['total']} groups.")
+    else:
+        st.success(f"✅ Successfully left {status['left']}/{status['total']} groups!")
+    if resolution_stats:
+        st.caption("Entity resolution: " + ", ".join(
+            f"{path}: {count}" for path, count in sorted(resolution_stats.items())
+        ))
+
+def _archive_and_index(manager, api_id, api_hash, session_string, groups, undo):
+    """Archive (or unarchive) groups, recording their new folder in the dialog index when done"""
+    done = []
+    try:
+        results = manager.stream(
+            api_id, api_hash, session_string, lambda client: archive_groups(client, groups, undo=undo)
+        )
+        for entity_info, error in results:
+            if not error:
+                done.append(entity_info)
+            yield entity_info, error
+    finally:
+        DialogIndex.for_session(session_string).set_folder(done, 0 if undo else ARCHIVE_FOLDER_ID)
+
+def start_archive(api_id, api_hash, groups, undo=False):
+    """Archive and mute groups (or undo that) in the background"""
+    st.session_state.archive_task = submit_task(
+        _archive_and_index(get_client_manager(), int(api_id), api_hash, st.session_state.session_string,
+                           groups, undo),
+        "archive"
+    )
+    st.session_state.archive_total = len(groups)
+    st.session_state.archive_undo = undo
+
+@st.fragment(run_every=1.0)
+def archive_progress():
+    """Poll the running archive batch; only this fragment reruns until it finishes"""
+    task = st.session_state.archive_task
+    if show_queued(task):
+        return
+    total = st.session_state.archive_total
+    results = list(task.items)
+    errors = [(info.title, error) for info, error in results if error]
+    verb = "Restored" if st.session_state.archive_undo else "Archived"
+    st.progress(
+        len(results) / total if total else 1.0,
+        text=f"{verb} {len(results) - len(errors)} · {len(errors)} failed · {total} total · {task.elapsed:.0f}s"
+    )
+    
+    if not task.done:
+        return
+    
+    del st.session_state.archive_task
+    st.session_state.archive_result = {
+        'done': [info for info, error in results if not error], 'errors': errors, 'total': total,
+        'undo': st.session_state.archive_undo, 'error': str(task.error) if task.error else None
+    }
+    st.rerun()
+
+def show_archive_result(api_id, api_hash):
+    """Report the last archive batch and offer to undo it"""
+    result = st.session_state.get('archive_result')
+    if result is None:
+        return
+    for title, error in result['errors']:
+        st.error(f"Error archiving {title}: {error}")
+    if result['error']:
+        st.error(f"Error during archiving: {result['error']}")
+    if result['undo']:
+        st.success(f"↩️ Restored {len(result['done'])}/{result['total']} groups to the main chat list.")
+        del st.session_state.archive_result
+        return
+    st.success(f"🗄️ Archived and muted {len(result['done'])}/{result['total']} groups.")
+    col1, col2 = st.columns(2)
+    with col1:
+        if result['done'] and st.button("↩️ Undo archive"):
+            del st.session_state.archive_result
+            start_archive(api_id, api_hash, result['done'], undo=True)
+            st.rerun()
+    with col2:
+        if st.button("OK", key="archive_result_ok"):
+            del st.session_state.archive_result
+            st.rerun()
+
+def show_unfinished_jobs(api_id, api_hash):
+    """Offer to resume or discard leave jobs that were interrupted before finishing"""
+    journal = LeaveJournal.for_session(st.session_state.session_string)
+    tasks = get_leave_tasks()
+    for job in journal.unfinished_jobs():
+        remaining = job['pending'] + job['resolved']
+        task = tasks.get((st.session_state.session_string, job['job_id']))
+        if task is not None and not task.done:
+            st.info(f"▶️ Leave job #{job['job_id']} is running: {job['left']}/{job['total']} groups left.")
+            if st.button("Show progress", key=f"watch_job_{job['job_id']}"):
+                start_leave(api_id, api_hash, job['job_id'])
+                st.rerun()
+            continue
+        st.warning(
+            f"⏸️ Leave job #{job['job_id']} was interrupted: {job['left']}/{job['total']} groups left, "
+            f"{remaining} remaining."
+        )
+        col1, col2 = st.columns(2)
+        with col1:
+            resume = st.button("▶️ Resume", key=f"resume_job_{job['job_id']}")
+        with col2:
+            discard = st.button("🗑️ Discard", key=f"discard_job_{job['job_id']}")
+        if resume:
+            start_leave(api_id, api_hash, job['job_id'])
+            st.rerun()
+        elif discard:
+            journal.discard(job['job_id'])
+            st.rerun()
+
+def show_diagnostics():
+    """Collapsible panel with request latencies, retries and flood waits for this process"""
+    with st.expander("🩺 Diagnostics"):
+        data = metrics.to_dict()
+        if not data['counters'] and not data['histograms']:
+            st.caption("No Telegram requests made yet.")
+            return
+        
+        flood_seconds = sum(metrics.counter_values('flood_wait_seconds_total', 'rpc').values())
+        flood_count = sum(metrics.counter_values('flood_waits_total', 'rpc').values())
+        st.caption(f"Flood waits: {flood_count} ({flood_seconds}s requested by Telegram)")
+        pool = get_task_queue()
+        usage = pool.stats().values()
+        st.caption(
+            f"Background workers: {sum(u['running'] for u in usage)}/{pool.workers} busy · "
+            f"{sum(u['queued'] for u in usage)} tasks queued across {len(usage)} accounts"
+        )
+        
+        st.dataframe([
+            {
+                'Metric': h['name'],
+                'Labels': ", ".join(f"{k}={v}" for k, v in h['labels'].items()),
+                'Count': h['count'],
+                'Mean (ms)': round(h['sum'] / h['count'] * 1000, 1),
+                'p50 (ms)': round(h['p50'] * 1000, 1),
+                'p95 (ms)': round(h['p95'] * 1000, 1),
+            }
+            for h in data['histograms']
+        ])
+        st.dataframe([
+            {
+                'Counter': c['name'],
+                'Labels': ", ".join(f"{k}={v}" for k, v in c['labels'].items()),
+                'Value': c['value'],
+            }
+            for c in data['counters']
+        ])
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Prometheus text", metrics.to_prometheus(), file_name="exit_tool_metrics.prom")
+        with col2:
+            st.download_button("JSON", metrics.to_json(), file_name="exit_tool_metrics.json")
+
+# Logout functionality; "forget" also deletes the saved login so the next one needs a code
+forget_login = st.session_state.get('logged_in') and get_session_store()[0] is not None and st.sidebar.button(
+    "🗑️ Logout and forget saved login", key="forget_login"
+)
+if forget_login:
+    get_session_store()[0].delete(st.session_state.get('phone'))
+if st.sidebar.button("🚪 Logout", key="logout") or forget_login:
+    for task_key in ['search_task', 'leave_task', 'archive_task', 'enrich_task']:
+        if st.session_state.get(task_key):
+            st.session_state[task_key].cancel()
+    if st.session_state.get('session_string'):
+        get_client_manager().close(st.session_state.session_string)
+    if st.session_state.get('authenticator'):
+        get_client_manager().run_coroutine(st.session_state.authenticator.disconnect())
+    for key in ['client', 'logged_in', 'phone_entered', 'code_sent', 'phone', 'phone_code_hash', 'session_string', 'found_groups', 'search_complete', 'requires_2fa', 'authenticator', 'temp_session', 'search_task', 'leave_task', 'leave_job', 'archive_task', 'archive_result', 'enrich_task', 'saved_login_revoked', 'prepared_export', 'login_passphrase']:
         if key in st.session_state:
             del st.session_state[key]
     st.rerun()
 
 # Run the main function
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
+    show_diagnostics() 
\ No newline at end of file
@@ -0,0 +1,209 @@
+"""Search, leave and archive throughput benchmarks against FakeTelegramClient.
+
+    python -m benchmarks.bench --sizes 1000 10000 100000 --leaves 200 --latency 0.005
+
+Prints one JSON object per scenario and dialog count with throughput,
+latency percentiles, peak traced memory, RPC counts and flood waits.
+"""
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+# Keep benchmark indexes out of the working directory; must happen before exit_tool reads its config
+os.environ.setdefault("DIALOG_INDEX_DIR", tempfile.mkdtemp(prefix="exit-tool-bench-"))
+
+from exit_tool import DialogIndex, RateScheduler, TitleIndex, get_target_groups_sync, metrics, normalize_title
+from exit_tool.archive import archive_groups
+from exit_tool.client import ClientManager
+from exit_tool.leave import leave_entity_by_info, leave_groups_pipelined
+from exit_tool.timeouts import HEDGED_REQUESTS, TimeoutPolicy
+
+from .fake_telegram import FakeTelegramClient
+
+# Title lookups timed per size, as (query, allowed typos); the short ones fall back to fewer typos
+TITLE_LOOKUPS = [
+    ("crypto", 0), ("crypto", 1), ("casnio", 1), ("fotball", 1), ("music group", 2),
+    ("trading spam", 2), ("ab", 1), ("n", 2), ("xyzzy", 1),
+]
+
+# Titles compared against a brute-force scan before the lookups are timed
+TITLE_CHECK_SIZE = 500
+
+def levenshtein_substring(pattern, text):
+    """Reference for TitleIndex: plain dynamic-programming distance from pattern to its best substring of text"""
+    previous = [0] * (len(text) + 1)
+    for i, p in enumerate(pattern, 1):
+        current = [i]
+        for j, t in enumerate(text, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (p != t)))
+        previous = current
+    return min(previous)
+
+def check_title_lookups(records):
+    """Exit if TitleIndex disagrees with a brute-force scan of records on any timed lookup"""
+    title_index = TitleIndex(records)
+    for query, typos in TITLE_LOOKUPS:
+        folded = normalize_title(query)
+        allowed = min(typos, title_index.max_typos(query))
+        expected = [
+            record for record in records if levenshtein_substring(folded, normalize_title(record.title)) <= allowed
+        ]
+        found = title_index.search(query, max_distance=typos)
+        if sorted(record.key for record in found) != sorted(record.key for record in expected):
+            raise SystemExit(
+                f"TitleIndex lookup {query!r} with {typos} typo(s) found {len(found)} titles, expected {len(expected)}"
+            )
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    if len(samples) == 1:
+        return {'p50_ms': samples[0] * 1000, 'p95_ms': samples[0] * 1000, 'p99_ms': samples[0] * 1000}
+    cuts = statistics.quantiles(samples, n=100, method='inclusive')
+    return {'p50_ms': cuts[49] * 1000, 'p95_ms': cuts[94] * 1000, 'p99_ms': cuts[98] * 1000}
+
+class Measurement:
+    """Times a block and records peak traced memory while it runs"""
+
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.seconds = 0.0
+        self.peak_mib = None
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._started
+        if self.trace_memory:
+            self.peak_mib = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+
+def report(scenario, dialogs, items, measurement, client, samples=()):
+    result = {
+        'scenario': scenario,
+        'dialogs': dialogs,
+        'items': items,
+        'seconds': round(measurement.seconds, 4),
+        'throughput_per_s': round(items / measurement.seconds, 1) if measurement.seconds else None,
+        **{k: round(v, 3) for k, v in percentiles(sorted(samples)).items()},
+        'peak_mib': round(measurement.peak_mib, 2) if measurement.peak_mib is not None else None,
+        'rpcs': dict(client.rpc_counts),
+        'flood_waits': client.flood_waits,
+        'timeouts': sum(metrics.counter_values('rpc_timeouts_total', 'rpc').values()),
+        'hedges': sum(metrics.counter_values('rpc_hedges_total', 'rpc').values()),
+    }
+    print(json.dumps(result), flush=True)
+    client.rpc_counts.clear()
+    client.flood_waits = 0
+    client.leave_latencies.clear()
+    client.call_latencies.clear()
+    metrics.reset()
+
+def run_size(n_dialogs, args):
+    timeouts = None
+    if args.adaptive_timeouts:
+        # The fake's pseudo requests for dialog pages and entity lookups are reads too
+        timeouts = TimeoutPolicy(min_timeout=args.min_timeout, hedged=HEDGED_REQUESTS | {'_DialogsPage', '_ResolveEntity'})
+    scheduler = RateScheduler(
+        rate=args.rate, max_rate=args.rate_max, burst=args.burst, max_flood_wait=60, timeouts=timeouts
+    )
+    client = FakeTelegramClient(
+        n_dialogs, latency=args.latency, jitter=args.jitter, flood_rate=args.flood_rate,
+        flood_seconds=args.flood_seconds, scheduler=scheduler, stall_rate=args.stall_rate,
+        stall_seconds=args.stall_seconds
+    )
+    manager = ClientManager(client_factory=lambda api_id, api_hash, session_string: client)
+    session = f"bench-{n_dialogs}-{time.time_ns()}"
+    try:
+        with Measurement(args.memory) as m:
+            matches = get_target_groups_sync(0, "", ["spam"], session, force_refresh=True, manager=manager)
+        report('search_full_scan', n_dialogs, n_dialogs, m, client, client.call_latencies['_DialogsPage'])
+
+        with Measurement(args.memory) as m:
+            get_target_groups_sync(0, "", ["spam"], session, manager=manager)
+        report('search_indexed', n_dialogs, n_dialogs, m, client)
+
+        records = DialogIndex.for_session(session).all()
+        check_title_lookups(records[:TITLE_CHECK_SIZE])
+        title_index = TitleIndex(records)
+        latencies = []
+        with Measurement(args.memory) as m:
+            for query, typos in TITLE_LOOKUPS:
+                started = time.perf_counter()
+                title_index.search(query, max_distance=typos, limit=200)
+                latencies.append(time.perf_counter() - started)
+        report('title_lookup', n_dialogs, len(TITLE_LOOKUPS), m, client, latencies)
+
+        # Every leave and archive scenario gets a share of the matches, however few the size produces
+        per_scenario = min(args.leaves, len(matches) // 3)
+        if not per_scenario:
+            raise SystemExit(f"{n_dialogs} dialogs gave {len(matches)} matches, too few to leave and archive")
+        sequential = matches[:per_scenario]
+        pipelined = matches[per_scenario:2 * per_scenario]
+
+        async def leave_one_by_one():
+            latencies = []
+            for record in sequential:
+                started = time.perf_counter()
+                await leave_entity_by_info(client, record)
+                latencies.append(time.perf_counter() - started)
+            return latencies
+
+        with Measurement(args.memory) as m:
+            latencies = manager.run_coroutine(leave_one_by_one())
+        report('leave_entity_by_info', n_dialogs, len(sequential), m, client, latencies)
+
+        async def leave_pipelined():
+            return [error async for _, error in leave_groups_pipelined(client, pipelined, args.concurrency)]
+
+        with Measurement(args.memory) as m:
+            manager.run_coroutine(leave_pipelined())
+        report('leave_pipelined', n_dialogs, len(pipelined), m, client, client.leave_latencies)
+
+        to_archive = matches[2 * per_scenario:]
+
+        async def archive_batched():
+            return [error async for _, error in archive_groups(client, to_archive)]
+
+        with Measurement(args.memory) as m:
+            manager.run_coroutine(archive_batched())
+        report('archive_batched', n_dialogs, len(to_archive), m, client)
+    finally:
+        manager.shutdown()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="Dialog counts")
+    parser.add_argument("--leaves", type=int, default=200,
+                        help="Most groups left per leave scenario (at most a third of the matches each)")
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.002, help="Extra random latency per request")
+    parser.add_argument("--flood-rate", type=float, default=0.0, help="Probability of a FloodWaitError per request")
+    parser.add_argument("--flood-seconds", type=int, default=1, help="Wait demanded by injected flood errors")
+    parser.add_argument("--stall-rate", type=float, default=0.0,
+                        help="Probability that a request hangs for --stall-seconds")
+    parser.add_argument("--stall-seconds", type=float, default=1.0, help="Extra latency of a stalled request")
+    parser.add_argument("--adaptive-timeouts", action="store_true",
+                        help="Give requests latency-based deadlines, retries and hedging")
+    parser.add_argument("--min-timeout", type=float, default=0.5,
+                        help="Lower bound for adaptive deadlines (the app's default is RPC_TIMEOUT_MIN_SECONDS)")
+    parser.add_argument("--rate", type=float, default=200.0, help="Initial scheduler rate (requests/s)")
+    parser.add_argument("--rate-max", type=float, default=1000.0, help="Maximum scheduler rate (requests/s)")
+    parser.add_argument("--burst", type=int, default=20, help="Scheduler burst size")
+    parser.add_argument("--concurrency", type=int, default=8, help="Pipelined leave concurrency")
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="Skip tracemalloc (it slows the measured code down)")
+    args = parser.parse_args(argv)
+    for n_dialogs in args.sizes:
+        run_size(n_dialogs, args)
+
+if __name__ == "__main__":
+    main()
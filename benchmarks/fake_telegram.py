@@ -0,0 +1,227 @@
+"""Local stand-in for TelegramClient with synthetic dialogs, injected latency and flood waits"""
+import asyncio
+import datetime
+import random
+import time
+from collections import Counter, defaultdict
+
+from telethon.errors import ChannelInvalidError, ChatIdInvalidError, FloodWaitError, MultiError, UserNotParticipantError
+from telethon.tl.functions.account import UpdateNotifySettingsRequest
+from telethon.tl.functions.channels import GetFullChannelRequest, LeaveChannelRequest
+from telethon.tl.functions.folders import EditPeerFoldersRequest
+from telethon.tl.functions.messages import DeleteChatUserRequest, GetFullChatRequest
+from telethon.tl.types import Channel, Chat, InputChannel, InputPeerChannel, PeerChannel, PeerChat
+
+from exit_tool.client import request_name
+from exit_tool.ratelimit import RateScheduler
+
+_WORDS = [
+    "crypto", "trading", "news", "family", "study", "music", "football", "casino",
+    "jobs", "travel", "photo", "games", "market", "books", "coding", "movies",
+]
+
+class _DialogsPage:
+    """Pseudo request for one page of GetDialogs"""
+
+    def __init__(self, offset):
+        self.offset = offset
+
+class _ResolveEntity:
+    """Pseudo request for a get_entity lookup"""
+
+    def __init__(self, target):
+        self.target = target
+
+class _FullChatResult:
+    """Just the parts of messages.ChatFull that enrichment reads"""
+
+    def __init__(self, full_chat, chat):
+        self.full_chat = full_chat
+        self.chats = [chat]
+
+class _FullChat:
+    def __init__(self, participants_count=None, linked_chat_id=None, participants=None):
+        self.participants_count = participants_count
+        self.linked_chat_id = linked_chat_id
+        self.participants = participants
+
+class FakeDialog:
+    __slots__ = ('entity', 'date', 'pinned', 'folder_id')
+
+    def __init__(self, entity, date, pinned=False, folder_id=None):
+        self.entity = entity
+        self.date = date
+        self.pinned = pinned
+        self.folder_id = folder_id
+
+class FakeTelegramClient:
+    """Serves n_dialogs deterministic dialogs and accepts leave requests.
+
+    Every request sleeps for `latency` seconds (plus up to `jitter`) and
+    raises FloodWaitError(flood_seconds) with probability `flood_rate`.
+    With probability `stall_rate` a request instead hangs for an extra
+    `stall_seconds`, like one stuck on a stalled connection.
+    Requests go through a RateScheduler exactly like ScheduledTelegramClient,
+    so the real pacing and retry logic is part of what gets measured.
+    Every tenth dialog is a basic Chat, the rest are Channels; one in
+    `match_every` titles contains the word "spam".
+    """
+
+    def __init__(self, n_dialogs, latency=0.0, jitter=0.0, flood_rate=0.0, flood_seconds=1,
+                 page_size=100, match_every=10, scheduler=None, seed=0, stall_rate=0.0, stall_seconds=0.0):
+        self.n_dialogs = n_dialogs
+        self.latency = latency
+        self.jitter = jitter
+        self.flood_rate = flood_rate
+        self.flood_seconds = flood_seconds
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.page_size = page_size
+        self.match_every = match_every
+        self.scheduler = scheduler or RateScheduler()
+        self.random = random.Random(seed)
+        self.left = set()
+        self.folders = {}
+        self.muted_until = {}
+        self.rpc_counts = Counter()
+        self.flood_waits = 0
+        self.leave_latencies = []
+        # Latency of every call by request name, retries and hedges included
+        self.call_latencies = defaultdict(list)
+        self._connected = False
+        self._epoch = time.time()
+
+    # Connection lifecycle, as used by ClientManager and the orchestrator
+    def is_connected(self):
+        return self._connected
+
+    async def connect(self):
+        await asyncio.sleep(self.latency)
+        self._connected = True
+
+    async def disconnect(self):
+        self._connected = False
+
+    async def is_user_authorized(self):
+        return True
+
+    # Synthetic data
+    def entity(self, i):
+        words = f"{_WORDS[i % len(_WORDS)]} {_WORDS[(i * 7) % len(_WORDS)]}"
+        title = f"{words} spam {i}" if i % self.match_every == 0 else f"{words} group {i}"
+        if i % 10 == 1:
+            return Chat(id=i, title=title, photo=None, participants_count=10, date=None, version=1)
+        return Channel(id=i, title=title, photo=None, date=None, access_hash=i * 31,
+                       username=f"group{i}" if i % 3 == 0 else None, megagroup=i % 2 == 0,
+                       creator=i % 50 == 0, forum=i % 2 == 0 and i % 9 == 0)
+
+    def dialog(self, i):
+        date = datetime.datetime.fromtimestamp(self._epoch - i * 60, datetime.timezone.utc)
+        # Every seventh dialog sits in the archive folder
+        return FakeDialog(self.entity(i), date, folder_id=1 if i % 7 == 0 else None)
+
+    # Requests
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        started = time.perf_counter()
+        try:
+            if isinstance(request, list):
+                return await self.scheduler.run(lambda: self._rpc_batch(request), request_name(request))
+            return await self.scheduler.run(lambda: self._rpc(request), type(request).__name__)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.call_latencies[request_name(request)].append(elapsed)
+            if isinstance(request, (LeaveChannelRequest, DeleteChatUserRequest)):
+                self.leave_latencies.append(elapsed)
+
+    async def _delay(self):
+        delay = self.latency + self.random.random() * self.jitter
+        if self.stall_rate and self.random.random() < self.stall_rate:
+            delay += self.stall_seconds
+        await asyncio.sleep(delay)
+
+    async def _rpc(self, request):
+        self.rpc_counts[type(request).__name__] += 1
+        await self._delay()
+        return self._answer(request)
+
+    async def _rpc_batch(self, requests):
+        """Several requests in one container: one round trip, answered (and failing) separately"""
+        self.rpc_counts[request_name(requests)] += 1
+        await self._delay()
+        results, exceptions = [], []
+        for request in requests:
+            self.rpc_counts[type(request).__name__] += 1
+            try:
+                results.append(self._answer(request))
+                exceptions.append(None)
+            except Exception as e:
+                results.append(None)
+                exceptions.append(e)
+        if any(exceptions):
+            raise MultiError(exceptions, results, requests)
+        return results
+
+    def _answer(self, request):
+        if self.flood_rate and self.random.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWaitError(request, self.flood_seconds)
+
+        if isinstance(request, _DialogsPage):
+            end = min(self.n_dialogs, request.offset + self.page_size)
+            return [self.dialog(i) for i in range(request.offset + 1, end + 1) if i not in self.left]
+        if isinstance(request, _ResolveEntity):
+            return self._resolve(request.target)
+        if isinstance(request, LeaveChannelRequest):
+            return self._leave(getattr(request.channel, 'channel_id', None) or request.channel.id, request)
+        if isinstance(request, DeleteChatUserRequest):
+            return self._leave(request.chat_id, request)
+        if isinstance(request, GetFullChannelRequest):
+            i = self._peer_index(request.channel, request)
+            return _FullChatResult(_FullChat(i * 13, linked_chat_id=i + 1 if i % 4 == 0 else None), self.entity(i))
+        if isinstance(request, GetFullChatRequest):
+            i = request.chat_id
+            if not 1 <= i <= self.n_dialogs or i in self.left:
+                raise ChatIdInvalidError(request)
+            return _FullChatResult(_FullChat(participants=None), self.entity(i))
+        if isinstance(request, EditPeerFoldersRequest):
+            for folder_peer in request.folder_peers:
+                i = self._peer_index(folder_peer.peer, request)
+                self.folders[i] = folder_peer.folder_id
+            return None
+        if isinstance(request, UpdateNotifySettingsRequest):
+            i = self._peer_index(request.peer.peer, request)
+            self.muted_until[i] = request.settings.mute_until
+            return None
+        raise NotImplementedError(type(request).__name__)
+
+    def _resolve(self, target):
+        if isinstance(target, str):
+            i = int(target.removeprefix("group"))
+        elif isinstance(target, (PeerChannel, InputPeerChannel, InputChannel)):
+            i = target.channel_id
+        elif isinstance(target, PeerChat):
+            i = target.chat_id
+        else:
+            i = int(target)
+        if not 1 <= i <= self.n_dialogs:
+            raise ValueError(f"Cannot find any entity corresponding to {target!r}")
+        return self.entity(i)
+
+    def _peer_index(self, peer, request):
+        i = getattr(peer, 'channel_id', None) or getattr(peer, 'chat_id', None)
+        if i is None or not 1 <= i <= self.n_dialogs or i in self.left:
+            raise ChannelInvalidError(request)
+        return i
+
+    def _leave(self, i, request):
+        if i in self.left or not 1 <= i <= self.n_dialogs:
+            raise UserNotParticipantError(request)
+        self.left.add(i)
+
+    async def iter_dialogs(self, **kwargs):
+        for offset in range(0, self.n_dialogs, self.page_size):
+            for dlg in await self(_DialogsPage(offset)):
+                yield dlg
+
+    async def get_entity(self, target):
+        return await self(_ResolveEntity(target))
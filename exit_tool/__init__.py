@@ -0,0 +1,47 @@
+"""Headless core of the Telegram Group Exit Tool.
+
+Everything here can be used without Streamlit. Modules that talk to
+Telegram (client, auth, leave) are only imported on first attribute access,
+so searching a fresh dialog index never loads telethon.
+"""
+import importlib
+
+from .enrich import GroupInfoCache, enrich_groups
+from .index import DialogFilter, DialogIndex
+from .jobs import LeaveJournal, run_leave_job
+from .matching import KeywordMatcher, normalize_title, split_terms
+from .metrics import Metrics, metrics
+from .orchestrator import run_account, run_accounts, run_accounts_sync
+from .ratelimit import RateScheduler, get_scheduler
+from .records import DialogRecord, GroupInfo
+from .search import get_target_groups_sync, stream_target_groups
+from .sessions import SessionStore, account_key
+from .snapshots import read_snapshot, write_snapshot
+from .tasks import BackgroundTask, TaskQueue
+from .timeouts import TimeoutPolicy, timeout_policy
+from .title_index import TitleIndex
+
+_LAZY = {
+    'ScheduledTelegramClient': '.client',
+    'ClientManager': '.client',
+    'default_manager': '.client',
+    'TelegramAuthenticator': '.auth',
+    'archive_groups': '.archive',
+    'leave_entity_by_info': '.leave',
+    'leave_groups_pipelined': '.leave',
+    'input_peer_from_info': '.leave',
+    'resolution_stats': '.leave',
+}
+
+__all__ = [
+    'DialogFilter', 'DialogIndex', 'DialogRecord', 'GroupInfo', 'GroupInfoCache', 'enrich_groups',
+    'KeywordMatcher', 'normalize_title', 'split_terms', 'TitleIndex', 'LeaveJournal', 'run_leave_job',
+    'BackgroundTask', 'TaskQueue', 'Metrics', 'metrics', 'RateScheduler', 'get_scheduler', 'TimeoutPolicy',
+    'timeout_policy', 'get_target_groups_sync', 'stream_target_groups', 'SessionStore', 'account_key',
+    'read_snapshot', 'write_snapshot', 'run_account', 'run_accounts', 'run_accounts_sync', *_LAZY,
+]
+
+def __getattr__(name):
+    if name in _LAZY:
+        return getattr(importlib.import_module(_LAZY[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,106 @@
+"""Archive-and-mute: a reversible alternative to leaving, batched over many peers per request"""
+import logging
+
+from telethon.errors import FloodWaitError, MultiError, RPCError
+from telethon.tl.functions.account import UpdateNotifySettingsRequest
+from telethon.tl.functions.folders import EditPeerFoldersRequest
+from telethon.tl.types import InputFolderPeer, InputNotifyPeer, InputPeerNotifySettings
+
+from .config import ARCHIVE_BATCH_SIZE
+from .index import ARCHIVE_FOLDER_ID
+from .leave import input_peer_from_info
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# mute_until value Telegram clients use for "mute forever"
+MUTE_FOREVER = 2 ** 31 - 1
+
+async def _send_batch(client, requests):
+    """Send requests together in one message container, returning {position: error} for failures.
+
+    Telegram answers each request in a container separately. Requests of a
+    container that hit a flood wait are retried once the account's
+    RateScheduler has paused for it; other failures are returned without
+    retrying. A FloodWaitError raised for the whole send has already been
+    waited out and retried by the scheduler, so it is re-raised.
+    """
+    scheduler = getattr(client, 'scheduler', None)
+    max_retries = scheduler.max_retries if scheduler else 0
+    pending = list(range(len(requests)))
+    errors = {}
+    for attempt in range(max_retries + 1):
+        try:
+            await client([requests[i] for i in pending])
+            return errors
+        except MultiError as e:
+            outcomes = list(zip(pending, e.exceptions))
+        except FloodWaitError:
+            raise
+        except RPCError as e:
+            # A container of one request raises its error directly
+            outcomes = [(i, e) for i in pending]
+        flooded = [(i, exc) for i, exc in outcomes if isinstance(exc, FloodWaitError)]
+        for i, exc in outcomes:
+            if exc is not None and not isinstance(exc, FloodWaitError):
+                errors[i] = str(exc)
+        if not flooded:
+            return errors
+        seconds = max(exc.seconds for _, exc in flooded)
+        if scheduler is None or seconds > scheduler.max_flood_wait or attempt == max_retries:
+            errors.update((i, str(exc)) for i, exc in flooded)
+            return errors
+        scheduler.on_flood_wait(seconds)
+        pending = [i for i, _ in flooded]
+    return errors
+
+async def archive_groups(client, entity_infos, mute=True, undo=False, batch_size=ARCHIVE_BATCH_SIZE):
+    """Move groups to the archive folder (and mute them), yielding (entity_info, error) per group.
+
+    Peers are built from the stored access_hash, and each batch of up to
+    batch_size groups costs one EditPeerFoldersRequest plus, when muting,
+    one container of notify-settings updates. Telegram has no bulk mute
+    call, so those are separate requests sharing a single round trip.
+    undo moves the groups back to the main list and unmutes them.
+    Raises FloodWaitError when Telegram keeps asking to wait after the
+    account's RateScheduler has given up retrying.
+    """
+    folder_id = 0 if undo else ARCHIVE_FOLDER_ID
+    mute_until = 0 if undo else MUTE_FOREVER
+    entity_infos = list(entity_infos)
+
+    for start in range(0, len(entity_infos), batch_size):
+        batch = []
+        for entity_info in entity_infos[start:start + batch_size]:
+            peer = input_peer_from_info(entity_info)
+            if peer is None:
+                metrics.inc('archive_results_total', result='failed')
+                yield entity_info, "No stored access_hash; re-download the dialog list first"
+            else:
+                batch.append((entity_info, peer))
+        if not batch:
+            continue
+
+        errors = {}
+        try:
+            await client(EditPeerFoldersRequest([InputFolderPeer(peer, folder_id) for _, peer in batch]))
+        except FloodWaitError:
+            # Still flooded after the scheduler's own retries; one request per peer would only make it worse
+            raise
+        except RPCError as e:
+            # One bad peer fails the whole request, so find it by sending them separately
+            logger.info("Batched folder change failed (%s), retrying peer by peer", e)
+            errors = await _send_batch(
+                client, [EditPeerFoldersRequest([InputFolderPeer(peer, folder_id)]) for _, peer in batch]
+            )
+        if mute:
+            settings = InputPeerNotifySettings(mute_until=mute_until)
+            mute_errors = await _send_batch(
+                client, [UpdateNotifySettingsRequest(InputNotifyPeer(peer), settings) for _, peer in batch]
+            )
+            for i, error in mute_errors.items():
+                errors.setdefault(i, error)
+
+        for i, (entity_info, _) in enumerate(batch):
+            metrics.inc('archive_results_total', result='failed' if i in errors else 'archived')
+            yield entity_info, errors.get(i)
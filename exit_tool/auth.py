@@ -0,0 +1,236 @@
+"""Phone-code and 2FA login that keeps one connection across steps"""
+import asyncio
+import time
+
+from telethon.sessions import StringSession
+from telethon.errors import (
+    FloodWaitError, PhoneCodeExpiredError, PhoneCodeInvalidError, RPCError, SessionPasswordNeededError,
+    UnauthorizedError
+)
+from telethon.tl.functions.updates import GetStateRequest
+
+from .client import ScheduledTelegramClient
+from .ratelimit import RateScheduler
+from .timeouts import connect_with_retries, timeout_policy
+
+class TelegramAuthenticator:
+    def __init__(self, api_id, api_hash):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.client = None
+        self.phone_code_hash = None
+        # Deadlines follow observed latency instead of fixed numbers
+        self.timeouts = timeout_policy
+        # Set by start_auth when the saved session it was given is no longer authorized
+        self.revoked_session = False
+        # Per-step split between connecting, the request itself and waiting on the user
+        self.step_timings = []
+        self._last_step_end = None
+        
+    async def _connect(self, timing, session_string=None):
+        """Reuse the live login connection, reconnecting or rebuilding the client only when needed"""
+        started = time.monotonic()
+        try:
+            if self.client is None:
+                self.client = ScheduledTelegramClient(
+                    StringSession(session_string), 
+                    self.api_id, 
+                    self.api_hash,
+                    connection_retries=1,
+                    retry_delay=1,
+                    # Login flood waits are reported to the user rather than slept through
+                    scheduler=RateScheduler(max_flood_wait=0, timeouts=self.timeouts)
+                )
+            if not self.client.is_connected():
+                await connect_with_retries(self.client, self.timeouts, purpose='login')
+        finally:
+            timing['connect'] = time.monotonic() - started
+    
+    async def disconnect(self):
+        """Close the login connection, e.g. when the user starts over"""
+        try:
+            if self.client:
+                await self.client.disconnect()
+        except:
+            pass
+        self.client = None
+    
+    async def _is_authorized(self):
+        """True if the session is logged in, False only if Telegram rejects it as unauthorized.
+
+        Unlike TelegramClient.is_user_authorized, other errors (flood waits,
+        transient RPC failures) are raised instead of being read as "logged out".
+        """
+        try:
+            await self.client(GetStateRequest())
+            return True
+        except UnauthorizedError:
+            # AuthKeyUnregistered, SessionRevoked, UserDeactivated and the other 401 errors
+            return False
+    
+    def release_client(self):
+        """Hand the connected, logged-in client over to the caller"""
+        client, self.client = self.client, None
+        return client
+    
+    def _begin_step(self, step):
+        now = time.monotonic()
+        user_wait = now - self._last_step_end if self._last_step_end else 0.0
+        return {'step': step, 'user_wait': user_wait, 'connect': 0.0, 'started': now}
+    
+    def _end_step(self, timing):
+        self._last_step_end = time.monotonic()
+        timing['request'] = self._last_step_end - timing.pop('started') - timing['connect']
+        self.step_timings.append(timing)
+    
+    def timing_summary(self):
+        """One line per login step describing where its time went"""
+        return [
+            f"{t['step']}: waited {t['user_wait']:.1f}s for input, "
+            f"connect {t['connect']:.1f}s, request {t['request']:.1f}s"
+            for t in self.step_timings
+        ]
+        
+    async def start_auth(self, phone, session_string=None):
+        """Start authentication process and send verification code.
+        
+        A saved session_string is tried first, and the code is only sent
+        when Telegram no longer accepts it; revoked_session then tells the
+        caller to forget the saved session.
+        """
+        timing = self._begin_step("send_code")
+        self.revoked_session = False
+        try:
+            # Add timeout to prevent hanging
+            try:
+                await self._connect(timing, session_string)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Connection timeout - please check your internet connection"
+            
+            # Check if already authorized
+            try:
+                is_authorized = await asyncio.wait_for(
+                    self._is_authorized(), 
+                    timeout=self.timeouts.budget('GetStateRequest')
+                )
+                if is_authorized:
+                    return True, self.client.session.save(), "already_authorized"
+                if session_string:
+                    # The saved session was revoked (logged out elsewhere); start over with a new one
+                    self.revoked_session = True
+                    await self.disconnect()
+                    await self._connect(timing)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Authorization check timeout"
+            except FloodWaitError as e:
+                return False, None, f"Rate limited - please wait {e.seconds} seconds"
+            except RPCError as e:
+                # Not an authorization failure, so a saved session stays saved
+                return False, None, f"Could not check the login: {str(e)}"
+            
+            # Send code request with timeout
+            try:
+                sent_code = await asyncio.wait_for(
+                    self.client.send_code_request(phone), 
+                    timeout=self.timeouts.budget('SendCodeRequest')
+                )
+                self.phone_code_hash = sent_code.phone_code_hash
+                
+                # The connection stays open for verify_code; the session string is
+                # only used to rebuild the client if the authenticator is lost
+                return False, self.client.session.save(), "code_sent"
+                
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Code request timeout - please try again"
+            except FloodWaitError as e:
+                return False, None, f"Rate limited - please wait {e.seconds} seconds"
+            except Exception as e:
+                error_msg = str(e).lower()
+                if "phone number" in error_msg:
+                    return False, None, "Invalid phone number format"
+                elif "flood" in error_msg:
+                    return False, None, "Too many attempts - please wait and try again"
+                else:
+                    return False, None, f"Failed to send code: {str(e)}"
+                    
+        except Exception as e:
+            await self.disconnect()
+            return False, None, f"Connection error: {str(e)}"
+        finally:
+            self._end_step(timing)
+    
+    async def verify_code(self, phone, code, session_string):
+        """Verify the code on the connection that requested it"""
+        timing = self._begin_step("verify_code")
+        try:
+            try:
+                await self._connect(timing, session_string)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Connection timeout during verification"
+            
+            try:
+                # Use the stored phone_code_hash for verification
+                await asyncio.wait_for(
+                    self.client.sign_in(phone, code, phone_code_hash=self.phone_code_hash),
+                    timeout=self.timeouts.budget('SignInRequest')
+                )
+                
+                # Save the authenticated session
+                return True, self.client.session.save(), "success"
+                
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Verification timeout - please try again"
+            except PhoneCodeExpiredError:
+                return False, None, "code_expired"
+            except PhoneCodeInvalidError:
+                return False, None, "invalid_code"
+            except SessionPasswordNeededError:
+                return False, self.client.session.save(), "2fa_required"
+            except Exception as e:
+                error_msg = str(e).lower()
+                if "password" in error_msg or "two-factor" in error_msg:
+                    return False, self.client.session.save(), "2fa_required"
+                else:
+                    return False, None, f"Sign-in error: {str(e)}"
+                        
+        except Exception as e:
+            await self.disconnect()
+            return False, None, f"Verification error: {str(e)}"
+        finally:
+            self._end_step(timing)
+    
+    async def verify_2fa(self, password, session_string):
+        """Verify 2FA password"""
+        timing = self._begin_step("verify_2fa")
+        try:
+            try:
+                await self._connect(timing, session_string)
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "Connection timeout during 2FA"
+            
+            try:
+                await asyncio.wait_for(
+                    self.client.sign_in(password=password),
+                    # Signing in with a password fetches the SRP parameters first
+                    timeout=(
+                        self.timeouts.budget('GetPasswordRequest') + self.timeouts.budget('CheckPasswordRequest')
+                    )
+                )
+                return True, self.client.session.save(), "success"
+            except asyncio.TimeoutError:
+                await self.disconnect()
+                return False, None, "2FA timeout - please try again"
+            except Exception as e:
+                return False, None, f"2FA error: {str(e)}"
+                    
+        except Exception as e:
+            await self.disconnect()
+            return False, None, f"2FA connection error: {str(e)}"
+        finally:
+            self._end_step(timing)
@@ -0,0 +1,273 @@
+"""Command line interface emitting JSON lines, for scripted and scheduled cleanups.
+
+    python -m exit_tool search --session-file me.session --keywords crypto casino
+    python -m exit_tool leave --session-file me.session --keywords crypto --yes
+    python -m exit_tool leave --session-file me.session --resume --yes
+    python -m exit_tool archive --session-file me.session --keywords crypto
+    python -m exit_tool export --session-file me.session --keywords crypto --output crypto.parquet
+    python -m exit_tool batch --session-file accounts/*.session --keywords crypto --leave --yes
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+from .config import ARCHIVE_BATCH_SIZE, LEAVE_CONCURRENCY
+from .index import ARCHIVE_FOLDER_ID, DialogFilter, DialogIndex
+from .jobs import LeaveJournal, run_leave_job
+from .metrics import metrics
+from .search import get_target_groups_sync, stream_target_groups
+from .sessions import account_key
+from .snapshots import FORMATS, read_snapshot, write_snapshot
+
+def emit(event, **fields):
+    """Write one JSON object per line to stdout"""
+    print(json.dumps({'event': event, **fields}, ensure_ascii=False), flush=True)
+
+def read_session_file(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read().strip()
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--api-id", type=int, default=os.getenv("TELEGRAM_API_ID"),
+                        help="Telegram API ID (default: $TELEGRAM_API_ID)")
+    common.add_argument("--api-hash", default=os.getenv("TELEGRAM_API_HASH"),
+                        help="Telegram API Hash (default: $TELEGRAM_API_HASH)")
+    common.add_argument("--keywords", nargs="*", default=[], help="Keywords to look for in titles")
+    common.add_argument("--regex", nargs="*", default=[], help="Case-insensitive title regexes")
+    common.add_argument("--exclude", nargs="*", default=[], help="Never match titles containing these")
+    common.add_argument("--normalize", action="store_true",
+                        help="Match look-alike characters, fullwidth letters and emoji-padded titles")
+    common.add_argument("--kind", nargs="+", choices=DialogFilter.KINDS, default=None,
+                        help="Only look at these kinds of dialogs")
+    common.add_argument("--archived", choices=["include", "exclude", "only"], default="include",
+                        help="Whether dialogs in the archive folder are searched")
+    common.add_argument("--inactive-days", type=int, default=None,
+                        help="Only look at dialogs with no activity for at least this many days")
+    common.add_argument("--full-refresh", action="store_true",
+                        help="Re-download the full dialog list instead of refreshing incrementally")
+    common.add_argument("--metrics", action="store_true",
+                        help="Print a final 'metrics' line with request latencies, retries and flood waits")
+    common.add_argument("-v", "--verbose", action="store_true", help="Log progress to stderr")
+
+    parser = argparse.ArgumentParser(prog="exit-tool", description="Telegram Group Exit Tool")
+    commands = parser.add_subparsers(dest="command", required=True)
+    search = commands.add_parser("search", parents=[common], help="List matching groups")
+    search.add_argument("--session-file", required=True, help="File containing a Telethon StringSession")
+    leave = commands.add_parser("leave", parents=[common], help="Leave matching groups")
+    leave.add_argument("--session-file", required=True, help="File containing a Telethon StringSession")
+    leave.add_argument("--concurrency", type=int, default=LEAVE_CONCURRENCY,
+                       help="Groups resolved and left at the same time")
+    leave.add_argument("--from-snapshot", metavar="PATH",
+                       help="Leave the groups listed in a snapshot file instead of searching")
+    leave.add_argument("--resume", nargs="?", type=int, const=0, default=None, metavar="JOB_ID",
+                       help="Finish an interrupted leave job (default: the newest one) instead of searching")
+    leave.add_argument("--retry-failed", action="store_true", help="With --resume, also retry groups that failed")
+    leave.add_argument("--yes", action="store_true", help="Confirm leaving every matching group")
+    archive = commands.add_parser("archive", parents=[common], help="Archive and mute matching groups")
+    archive.add_argument("--session-file", required=True, help="File containing a Telethon StringSession")
+    archive.add_argument("--no-mute", dest="mute", action="store_false", help="Only archive, keep notifications")
+    archive.add_argument("--undo", action="store_true",
+                         help="Move matching groups back to the main list and unmute them")
+    archive.add_argument("--from-snapshot", metavar="PATH",
+                         help="Archive the groups listed in a snapshot file instead of searching")
+    archive.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE, help="Groups per batched request")
+    export = commands.add_parser("export", parents=[common], help="Write matching groups to a snapshot file")
+    export.add_argument("--session-file", required=True, help="File containing a Telethon StringSession")
+    export.add_argument("--output", required=True, help="Snapshot file (.csv, .jsonl, .parquet or .arrow)")
+    export.add_argument("--format", choices=FORMATS, default=None, help="Snapshot format (default: from --output)")
+    export.add_argument("--all", action="store_true",
+                        help="Export every indexed dialog (after --kind/--archived/--inactive-days) instead of matches")
+    batch = commands.add_parser("batch", parents=[common], help="Search or leave for many accounts at once")
+    batch.add_argument("--session-file", nargs="+", required=True,
+                       help="Session files, one account each")
+    batch.add_argument("--leave", action="store_true", help="Leave matching groups instead of only counting them")
+    batch.add_argument("--concurrency", type=int, default=LEAVE_CONCURRENCY,
+                       help="Groups resolved and left at the same time, per account")
+    batch.add_argument("--max-parallel", type=int, default=None,
+                       help="Accounts processed at the same time per process (default: all)")
+    batch.add_argument("--processes", type=int, default=1, help="Worker processes to spread accounts across")
+    batch.add_argument("--yes", action="store_true", help="Confirm leaving every matching group")
+    return parser
+
+def dialog_filter_from_args(args):
+    archived = {'include': None, 'exclude': False, 'only': True}[args.archived]
+    return DialogFilter(args.kind, archived, args.inactive_days)
+
+def run_search(args, session_string):
+    started = time.monotonic()
+    groups = get_target_groups_sync(
+        args.api_id, args.api_hash, args.keywords, session_string,
+        force_refresh=args.full_refresh, patterns=args.regex, exclude=args.exclude,
+        normalize=args.normalize, dialog_filter=dialog_filter_from_args(args)
+    )
+    for group in groups:
+        emit('match', **group.to_dict())
+    emit('summary', command='search', matches=len(groups), elapsed=round(time.monotonic() - started, 3))
+    return 0
+
+def run_leave(args, session_string):
+    from .client import default_manager
+    from .leave import resolution_stats
+
+    started = time.monotonic()
+    journal = LeaveJournal.for_session(session_string)
+    if args.resume is not None:
+        job_id = args.resume
+        if not job_id:
+            unfinished = journal.unfinished_jobs()
+            if not unfinished:
+                emit('summary', command='leave', job_id=None, matches=0, left=0, failed=0,
+                     elapsed=round(time.monotonic() - started, 3))
+                return 0
+            job_id = unfinished[0]['job_id']
+        emit('job', resumed=True, **journal.status(job_id))
+    else:
+        if args.from_snapshot:
+            groups = read_snapshot(args.from_snapshot, account=account_key(session_string))
+        else:
+            groups = get_target_groups_sync(
+                args.api_id, args.api_hash, args.keywords, session_string,
+                force_refresh=args.full_refresh, patterns=args.regex, exclude=args.exclude,
+                normalize=args.normalize, dialog_filter=dialog_filter_from_args(args)
+            )
+        job_id = journal.create_job(groups)
+        emit('job', resumed=False, **journal.status(job_id))
+    left, failed = [], 0
+    results = default_manager().stream(
+        args.api_id, args.api_hash, session_string,
+        lambda client: run_leave_job(client, journal, job_id, args.concurrency,
+                                     retry_failed=args.resume is not None and args.retry_failed)
+    )
+    for entity_info, error in results:
+        if error:
+            failed += 1
+            emit('failed', **entity_info.to_dict(), error=error)
+        else:
+            left.append(entity_info)
+            emit('left', **entity_info.to_dict())
+    DialogIndex.for_session(session_string).remove(left)
+    status = journal.status(job_id)
+    emit('summary', command='leave', job_id=job_id, matches=status['total'], left=status['left'], failed=failed,
+         resolution=dict(resolution_stats), elapsed=round(time.monotonic() - started, 3))
+    return 1 if failed else 0
+
+def run_archive(args, session_string):
+    from .archive import archive_groups
+    from .client import default_manager
+
+    started = time.monotonic()
+    if args.from_snapshot:
+        groups = list(read_snapshot(args.from_snapshot, account=account_key(session_string)))
+    else:
+        groups = get_target_groups_sync(
+            args.api_id, args.api_hash, args.keywords, session_string,
+            force_refresh=args.full_refresh, patterns=args.regex, exclude=args.exclude,
+            normalize=args.normalize, dialog_filter=dialog_filter_from_args(args)
+        )
+    done, failed = [], 0
+    results = default_manager().stream(
+        args.api_id, args.api_hash, session_string,
+        lambda client: archive_groups(client, groups, args.mute, args.undo, args.batch_size)
+    )
+    event = 'restored' if args.undo else 'archived'
+    try:
+        for entity_info, error in results:
+            if error:
+                failed += 1
+                emit('failed', **entity_info.to_dict(), error=error)
+            else:
+                done.append(entity_info)
+                emit(event, **entity_info.to_dict())
+    finally:
+        # Groups moved before a flood wait stopped the run are in the new folder all the same
+        DialogIndex.for_session(session_string).set_folder(done, 0 if args.undo else ARCHIVE_FOLDER_ID)
+    emit('summary', command='archive', undo=args.undo, matches=len(groups), **{event: len(done)}, failed=failed,
+         elapsed=round(time.monotonic() - started, 3))
+    return 1 if failed else 0
+
+def run_export(args, session_string):
+    started = time.monotonic()
+    dialog_filter = dialog_filter_from_args(args)
+    if args.all:
+        index = DialogIndex.for_session(session_string)
+        if args.full_refresh or not index.is_fresh():
+            from .client import default_manager
+            default_manager().run(
+                args.api_id, args.api_hash, session_string,
+                lambda client: index.refresh(client, full=args.full_refresh)
+            )
+        pages = index.iter_pages(dialog_filter)
+    else:
+        # Matches are written page by page while the dialog list is still being scanned
+        pages = (
+            matches for _, matches in stream_target_groups(
+                args.api_id, args.api_hash, args.keywords, session_string,
+                force_refresh=args.full_refresh, patterns=args.regex, exclude=args.exclude,
+                normalize=args.normalize, dialog_filter=dialog_filter
+            )
+        )
+    written = write_snapshot(pages, args.output, args.format, account=account_key(session_string))
+    emit('summary', command='export', output=args.output, written=written,
+         elapsed=round(time.monotonic() - started, 3))
+    return 0
+
+def run_batch(args):
+    from .orchestrator import run_accounts_sync
+
+    started = time.monotonic()
+    accounts = [(path, read_session_file(path)) for path in args.session_file]
+    reports = run_accounts_sync(
+        accounts, processes=args.processes, max_parallel=args.max_parallel,
+        api_id=args.api_id, api_hash=args.api_hash, keywords=args.keywords,
+        patterns=args.regex, exclude=args.exclude, leave=args.leave,
+        concurrency=args.concurrency, full_refresh=args.full_refresh, normalize=args.normalize,
+        dialog_filter=dialog_filter_from_args(args)
+    )
+    for report in reports:
+        emit('report', **report)
+    emit('summary', command='batch', accounts=len(reports),
+         errors=sum(1 for r in reports if r['error']),
+         matches=sum(r['matches'] for r in reports),
+         left=sum(len(r['left']) for r in reports),
+         failed=sum(len(r['failed']) for r in reports),
+         elapsed=round(time.monotonic() - started, 3))
+    return 1 if any(r['error'] or r['failed'] for r in reports) else 0
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    needs_terms = (getattr(args, 'resume', None) is None and not getattr(args, 'from_snapshot', None)
+                   and not getattr(args, 'all', False))
+    if needs_terms and not args.keywords and not args.regex:
+        parser.error("give at least one of --keywords or --regex")
+    if not args.api_id or not args.api_hash:
+        parser.error("--api-id and --api-hash (or TELEGRAM_API_ID / TELEGRAM_API_HASH) are required")
+    if (args.command == "leave" or getattr(args, 'leave', False)) and not args.yes:
+        parser.error("refusing to leave groups without --yes")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, stream=sys.stderr)
+
+    try:
+        if args.command == "batch":
+            return run_batch(args)
+        session_string = read_session_file(args.session_file)
+        if args.command == "search":
+            return run_search(args, session_string)
+        if args.command == "archive":
+            return run_archive(args, session_string)
+        if args.command == "export":
+            return run_export(args, session_string)
+        return run_leave(args, session_string)
+    except Exception as e:
+        emit('error', error=str(e))
+        return 2
+    finally:
+        if args.metrics:
+            emit('metrics', **metrics.to_dict())
+        # Only shut the client down if this run actually needed Telegram
+        client_module = sys.modules.get(f"{__package__}.client")
+        if client_module is not None:
+            client_module.shutdown_default_manager()
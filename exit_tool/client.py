@@ -0,0 +1,235 @@
+"""Rate-limited Telegram clients and the background-loop client manager"""
+import asyncio
+import queue
+import threading
+import time
+
+from telethon import TelegramClient
+from telethon.sessions import StringSession
+
+from .config import CLIENT_IDLE_SECONDS
+from .metrics import metrics
+from .ratelimit import RateScheduler, get_scheduler
+from .sessions import account_key
+from .timeouts import connect_with_retries, timeout_policy
+
+def request_name(request):
+    """Metrics label for a request, or for a list of requests sent in one container"""
+    if isinstance(request, list):
+        return f"{type(request[0]).__name__}[batch]" if request else "batch"
+    return type(request).__name__
+
+class ScheduledTelegramClient(TelegramClient):
+    """TelegramClient whose requests all go through a RateScheduler.
+
+    Telethon's own flood sleeping is disabled so every FloodWaitError reaches
+    the scheduler, which slows down the whole account instead of one call.
+    When a request times out the connection is assumed to have stalled and
+    is re-established before the retry.
+    """
+
+    def __init__(self, *args, scheduler=None, **kwargs):
+        kwargs.setdefault('flood_sleep_threshold', 0)
+        super().__init__(*args, **kwargs)
+        self.scheduler = scheduler or RateScheduler(timeouts=timeout_policy)
+        self._reconnected_at = 0.0
+        self._reconnect_lock = None
+
+    async def __call__(self, request, ordered=False, flood_sleep_threshold=None):
+        call = super().__call__
+        return await self.scheduler.run(
+            lambda: call(request, ordered, flood_sleep_threshold), request_name(request), self._reconnect
+        )
+
+    async def _reconnect(self, stalled_since):
+        """Reconnect once for a stall, however many requests in flight noticed it"""
+        if self._reconnect_lock is None:
+            self._reconnect_lock = asyncio.Lock()
+        async with self._reconnect_lock:
+            if self._reconnected_at >= stalled_since:
+                return
+            metrics.inc('reconnects_total', reason='stall')
+            await self.disconnect()
+            await connect_with_retries(self, self.scheduler.timeouts or timeout_policy, purpose='reconnect')
+            self._reconnected_at = time.monotonic()
+
+def new_client(api_id, api_hash, session_string):
+    """Build a ScheduledTelegramClient paced by the account's shared RateScheduler"""
+    return ScheduledTelegramClient(
+        StringSession(session_string or None), api_id, api_hash,
+        scheduler=get_scheduler(session_string)
+    )
+
+class _ClientEntry:
+    __slots__ = ('client', 'lock', 'last_used', 'active')
+
+    def __init__(self):
+        self.client = None
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.active = 0
+
+class ClientManager:
+    """Keeps one connected client per account on a dedicated event-loop thread.
+
+    Streamlit callbacks hand work to the background loop with run() or
+    stream() instead of building a client under a fresh asyncio.run(), so
+    the MTProto connection and DC handshake are paid once per account.
+    Dropped connections are re-established on the next use and clients
+    idle for longer than idle_timeout seconds are disconnected.
+    client_factory(api_id, api_hash, session_string) builds new clients and
+    can be replaced, e.g. with a local fake for benchmarks.
+    """
+
+    def __init__(self, idle_timeout=CLIENT_IDLE_SECONDS, client_factory=None):
+        self.idle_timeout = idle_timeout
+        self.client_factory = client_factory or new_client
+        self._clients = {}
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="telegram-client-loop", daemon=True)
+        self._thread.start()
+        self._reaper = asyncio.run_coroutine_threadsafe(self._reap_idle(), self.loop)
+
+    async def _acquire(self, api_id, api_hash, session_string):
+        key = (api_id, api_hash, account_key(session_string))
+        entry = self._clients.get(key)
+        if entry is None:
+            entry = self._clients[key] = _ClientEntry()
+        entry.active += 1
+        entry.last_used = time.monotonic()
+        try:
+            async with entry.lock:
+                if entry.client is None:
+                    entry.client = self.client_factory(api_id, api_hash, session_string)
+                elif not entry.client.is_connected():
+                    metrics.inc('reconnects_total')
+                if not entry.client.is_connected():
+                    timeouts = getattr(getattr(entry.client, 'scheduler', None), 'timeouts', None)
+                    await connect_with_retries(entry.client, timeouts or timeout_policy)
+        except BaseException:
+            entry.active -= 1
+            raise
+        return entry
+
+    def _release(self, entry):
+        entry.active -= 1
+        entry.last_used = time.monotonic()
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(60, self.idle_timeout))
+            now = time.monotonic()
+            for key, entry in list(self._clients.items()):
+                if not entry.active and now - entry.last_used > self.idle_timeout:
+                    del self._clients[key]
+                    if entry.client is not None:
+                        await entry.client.disconnect()
+
+    def run_coroutine(self, coro, timeout=None):
+        """Run a coroutine on the background loop and return its result"""
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+    def run(self, api_id, api_hash, session_string, func, timeout=None):
+        """Run the coroutine func(client) on the background loop and return its result"""
+        async def _run():
+            entry = await self._acquire(api_id, api_hash, session_string)
+            try:
+                return await func(entry.client)
+            finally:
+                self._release(entry)
+
+        return self.run_coroutine(_run(), timeout)
+
+    def adopt(self, api_id, api_hash, session_string, client):
+        """Take over an already connected client, such as the one used to log in"""
+        async def _adopt():
+            key = (api_id, api_hash, account_key(session_string))
+            if client is None or key in self._clients:
+                if client is not None:
+                    await client.disconnect()
+                return
+            entry = self._clients[key] = _ClientEntry()
+            client.scheduler = get_scheduler(session_string)
+            entry.client = client
+
+        self.run_coroutine(_adopt())
+
+    def stream(self, api_id, api_hash, session_string, func):
+        """Iterate, from the calling thread, over the async iterator func(client)"""
+        items = queue.Queue()
+        finished = object()
+
+        async def _pump():
+            entry = None
+            try:
+                entry = await self._acquire(api_id, api_hash, session_string)
+                async for item in func(entry.client):
+                    items.put(item)
+            finally:
+                # Always wake the consumer, so a failed connect is raised instead of hanging it
+                if entry is not None:
+                    self._release(entry)
+                items.put(finished)
+
+        future = asyncio.run_coroutine_threadsafe(_pump(), self.loop)
+        try:
+            while True:
+                item = items.get()
+                if item is finished:
+                    break
+                yield item
+            # Surface any exception raised on the background loop
+            future.result()
+        finally:
+            future.cancel()
+
+    def close(self, session_string):
+        """Disconnect every client belonging to the account behind session_string"""
+        key = account_key(session_string)
+
+        async def _close():
+            for client_key, entry in list(self._clients.items()):
+                if client_key[2] == key:
+                    del self._clients[client_key]
+                    if entry.client is not None:
+                        await entry.client.disconnect()
+
+        self.run_coroutine(_close())
+
+    def shutdown(self):
+        """Disconnect every client and stop the background loop"""
+        async def _shutdown():
+            for entry in list(self._clients.values()):
+                if entry.client is not None:
+                    await entry.client.disconnect()
+            self._clients.clear()
+
+        self._reaper.cancel()
+        self.run_coroutine(_shutdown())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+def default_manager():
+    """Process-wide ClientManager, created on first use"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = ClientManager()
+        return _default_manager
+
+def shutdown_default_manager():
+    """Disconnect and stop the process-wide ClientManager if it was ever created"""
+    global _default_manager
+    with _default_manager_lock:
+        manager, _default_manager = _default_manager, None
+    if manager is not None:
+        manager.shutdown()
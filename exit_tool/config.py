@@ -0,0 +1,54 @@
+"""Settings shared by the Streamlit app and the CLI, read from the environment (and .env)"""
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Local dialog index settings
+DIALOG_INDEX_DIR = os.getenv("DIALOG_INDEX_DIR", ".dialog_index")
+DIALOG_INDEX_REFRESH_SECONDS = int(os.getenv("DIALOG_INDEX_REFRESH_SECONDS", "60"))
+DIALOG_INDEX_MAX_AGE_SECONDS = int(os.getenv("DIALOG_INDEX_MAX_AGE_SECONDS", "86400"))
+# Durable leave jobs are journaled per account next to the dialog index
+LEAVE_JOURNAL_DIR = os.getenv("LEAVE_JOURNAL_DIR", DIALOG_INDEX_DIR)
+# Logged-in sessions are saved here, encrypted with a key derived from the user's passphrase and
+# SESSION_STORE_KEY; without a key (or without the cryptography package) nothing is saved
+SESSION_STORE_DIR = os.getenv("SESSION_STORE_DIR", DIALOG_INDEX_DIR)
+SESSION_STORE_KEY = os.getenv("SESSION_STORE_KEY", "")
+# Dialogs are stored and streamed to searches in pages of this size (Telegram returns 100 per request)
+DIALOG_PAGE_SIZE = int(os.getenv("DIALOG_PAGE_SIZE", "100"))
+
+# Adaptive RPC rate limiting (requests per second, shared per account)
+RPC_RATE_INITIAL = float(os.getenv("RPC_RATE_INITIAL", "1.0"))
+RPC_RATE_MIN = float(os.getenv("RPC_RATE_MIN", "0.2"))
+RPC_RATE_MAX = float(os.getenv("RPC_RATE_MAX", "10.0"))
+RPC_BURST = int(os.getenv("RPC_BURST", "5"))
+MAX_FLOOD_WAIT_SECONDS = int(os.getenv("MAX_FLOOD_WAIT_SECONDS", "900"))
+
+# Request deadlines adapt to observed latency (3 x p99) within these bounds; RPC_TIMEOUT_SECONDS
+# applies until enough answers have been seen. Timed-out requests are retried after a jittered
+# backoff, and up to RPC_HEDGE_RATIO of read requests may be sent twice when they are slow
+RPC_TIMEOUT_SECONDS = float(os.getenv("RPC_TIMEOUT_SECONDS", "30"))
+RPC_TIMEOUT_MIN_SECONDS = float(os.getenv("RPC_TIMEOUT_MIN_SECONDS", "2"))
+RPC_TIMEOUT_MAX_SECONDS = float(os.getenv("RPC_TIMEOUT_MAX_SECONDS", "120"))
+RPC_TIMEOUT_RETRIES = int(os.getenv("RPC_TIMEOUT_RETRIES", "2"))
+RPC_HEDGE_RATIO = float(os.getenv("RPC_HEDGE_RATIO", "0.05"))
+
+# Number of groups resolved/left at the same time
+LEAVE_CONCURRENCY = int(os.getenv("LEAVE_CONCURRENCY", "4"))
+
+# Groups archived (and muted) per batched request; 100 is the most one message container holds
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+
+# Member counts, admin status etc. fetched for matched groups are reused for this long
+GROUP_INFO_TTL_SECONDS = int(os.getenv("GROUP_INFO_TTL_SECONDS", "86400"))
+# Groups whose full info is fetched at the same time
+ENRICH_CONCURRENCY = int(os.getenv("ENRICH_CONCURRENCY", "4"))
+
+# Background searches, leave runs etc. share this many worker threads per server process,
+# and one account may use at most TASKS_PER_OWNER of them at a time
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "8"))
+TASKS_PER_OWNER = int(os.getenv("TASKS_PER_OWNER", "2"))
+
+# Shared clients are disconnected after this many idle seconds
+CLIENT_IDLE_SECONDS = int(os.getenv("CLIENT_IDLE_SECONDS", "900"))
@@ -0,0 +1,159 @@
+"""Member counts, admin status and forum/discussion details for matched groups, with a TTL cache"""
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from .config import DIALOG_INDEX_DIR, ENRICH_CONCURRENCY, GROUP_INFO_TTL_SECONDS
+from .metrics import metrics
+from .records import GroupInfo
+from .sessions import account_key
+
+class GroupInfoCache:
+    """Per-account on-disk cache of GroupInfo keyed by (type, id, access_hash).
+
+    Entries older than ttl seconds are treated as missing. The access_hash is
+    part of the key, so a group that was left and rejoined (and got a new
+    hash) is fetched again.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path, ttl=GROUP_INFO_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._init_schema()
+
+    @classmethod
+    def for_session(cls, session_string, directory=DIALOG_INDEX_DIR, ttl=GROUP_INFO_TTL_SECONDS):
+        """Open the cache belonging to the account of a session string"""
+        return cls(os.path.join(directory, f"{account_key(session_string)}.info.sqlite3"), ttl)
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _init_schema(self):
+        with self._connect() as conn, conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == self.SCHEMA_VERSION:
+                return
+            conn.execute("DROP TABLE IF EXISTS group_info")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS group_info (
+                    type TEXT NOT NULL,
+                    id INTEGER NOT NULL,
+                    access_hash INTEGER NOT NULL DEFAULT 0,
+                    members INTEGER,
+                    is_admin INTEGER NOT NULL,
+                    is_creator INTEGER NOT NULL,
+                    is_forum INTEGER NOT NULL,
+                    linked_chat_id INTEGER,
+                    fetched_at REAL NOT NULL,
+                    PRIMARY KEY (type, id, access_hash)
+                )
+            """)
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    @staticmethod
+    def _key(record):
+        return (record.type, record.id, record.access_hash or 0)
+
+    def get_many(self, records):
+        """Return {record.key: GroupInfo} for the records that have a fresh cache entry"""
+        wanted = {self._key(record): record.key for record in records}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT type, id, access_hash, members, is_admin, is_creator, is_forum, linked_chat_id, fetched_at "
+                "FROM group_info WHERE fetched_at > ?",
+                (time.time() - self.ttl,)
+            ).fetchall()
+        found = {}
+        for row in rows:
+            key = wanted.get(row[:3])
+            if key is not None:
+                found[key] = GroupInfo(row[3], bool(row[4]), bool(row[5]), bool(row[6]), row[7], row[8])
+        return found
+
+    def put_many(self, items):
+        """Store (record, GroupInfo) pairs and drop expired entries"""
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO group_info (type, id, access_hash, members, is_admin, is_creator, "
+                "is_forum, linked_chat_id, fetched_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (*self._key(record), info.members, info.is_admin, info.is_creator, info.is_forum,
+                     info.linked_chat_id, info.fetched_at)
+                    for record, info in items
+                ]
+            )
+            conn.execute("DELETE FROM group_info WHERE fetched_at <= ?", (time.time() - self.ttl,))
+
+def _admin_flags(chat):
+    is_creator = bool(getattr(chat, 'creator', False))
+    return is_creator or getattr(chat, 'admin_rights', None) is not None, is_creator
+
+async def fetch_group_info(client, record):
+    """Fetch full chat info for one group with a single RPC, built from the stored access_hash"""
+    from telethon.tl.functions.channels import GetFullChannelRequest
+    from telethon.tl.functions.messages import GetFullChatRequest
+    from telethon.tl.types import InputChannel
+
+    if record.type == 'Channel':
+        if record.access_hash is None:
+            raise ValueError("No stored access_hash; re-download the dialog list first")
+        result = await client(GetFullChannelRequest(InputChannel(record.id, record.access_hash)))
+        full = result.full_chat
+        chat = next((c for c in result.chats if c.id == record.id), None)
+        is_admin, is_creator = _admin_flags(chat)
+        return GroupInfo(
+            full.participants_count, is_admin, is_creator, bool(getattr(chat, 'forum', False)),
+            full.linked_chat_id, time.time()
+        )
+
+    result = await client(GetFullChatRequest(record.id))
+    chat = next((c for c in result.chats if c.id == record.id), None)
+    participants = getattr(result.full_chat.participants, 'participants', None)
+    members = len(participants) if participants is not None else getattr(chat, 'participants_count', None)
+    is_admin, is_creator = _admin_flags(chat)
+    return GroupInfo(members, is_admin, is_creator, False, None, time.time())
+
+async def enrich_groups(client, records, cache=None, concurrency=ENRICH_CONCURRENCY):
+    """Yield (record, GroupInfo or None, error) for every record, fetching what the cache lacks.
+
+    Cached entries are yielded first without any request. The rest are
+    fetched with up to `concurrency` requests in flight, paced (and
+    retried after flood waits) by the client's RateScheduler, and stored
+    in the cache as they arrive. Cache reads and writes run in the loop's
+    executor so a locked cache file never stalls other requests on the loop.
+    """
+    loop = asyncio.get_running_loop()
+    records = list(records)
+    cached = await loop.run_in_executor(None, cache.get_many, records) if cache is not None else {}
+    metrics.inc('group_info_cache_hits_total', len(cached))
+    for record in records:
+        if record.key in cached:
+            yield record, cached[record.key], None
+
+    missing = [record for record in records if record.key not in cached]
+    metrics.inc('group_info_cache_misses_total', len(missing))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _fetch(record):
+        async with semaphore:
+            try:
+                return record, await fetch_group_info(client, record), None
+            except Exception as e:
+                return record, None, str(e)
+
+    tasks = [asyncio.ensure_future(_fetch(record)) for record in missing]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            record, info, error = await next_done
+            if info is not None and cache is not None:
+                await loop.run_in_executor(None, cache.put_many, [(record, info)])
+            yield record, info, error
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,285 @@
+"""Persistent per-account index of dialogs"""
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from .config import (
+    DIALOG_INDEX_DIR, DIALOG_INDEX_REFRESH_SECONDS, DIALOG_INDEX_MAX_AGE_SECONDS, DIALOG_PAGE_SIZE
+)
+from .matching import KeywordMatcher
+from .metrics import metrics
+from .records import DialogRecord
+from .sessions import account_key
+
+ARCHIVE_FOLDER_ID = 1
+
+def dialog_kind(entity):
+    """'megagroup', 'broadcast' or 'chat' (basic group) for a titled entity"""
+    if type(entity).__name__ == 'Chat':
+        return 'chat'
+    if getattr(entity, 'megagroup', False) or getattr(entity, 'gigagroup', False):
+        return 'megagroup'
+    return 'broadcast'
+
+class DialogFilter:
+    """Narrows the dialogs a search looks at, before any title matching.
+
+    kinds restricts to some of 'megagroup', 'broadcast' and 'chat'. archived
+    is None for every dialog, True for only the archive folder and False to
+    leave the archive out. inactive_days keeps only dialogs whose last
+    activity is older than that many days. The filter is applied in the
+    index query, so dialogs it rejects are never loaded for a search.
+    """
+
+    KINDS = ('megagroup', 'broadcast', 'chat')
+
+    def __init__(self, kinds=None, archived=None, inactive_days=None):
+        kinds = tuple(kinds or ())
+        unknown = set(kinds) - set(self.KINDS)
+        if unknown:
+            raise ValueError(f"Unknown dialog kinds: {', '.join(sorted(unknown))}")
+        self.kinds = kinds
+        self.archived = archived
+        self.inactive_days = inactive_days
+
+    def __bool__(self):
+        return bool(self.kinds) or self.archived is not None or bool(self.inactive_days)
+
+    def _cutoff(self):
+        return time.time() - self.inactive_days * 86400
+
+    def where(self):
+        """Return an SQL condition over the dialogs table and its parameters"""
+        clauses, params = [], []
+        if self.kinds:
+            clauses.append(f"kind IN ({', '.join('?' * len(self.kinds))})")
+            params.extend(self.kinds)
+        if self.archived is not None:
+            clauses.append("folder_id = ?" if self.archived else "folder_id != ?")
+            params.append(ARCHIVE_FOLDER_ID)
+        if self.inactive_days:
+            clauses.append("date < ?")
+            params.append(self._cutoff())
+        return " AND ".join(clauses) or "1", params
+
+    def accepts_row(self, row):
+        """Same test as where(), for an index row that has not been queried back yet"""
+        if self.kinds and row[6] not in self.kinds:
+            return False
+        if self.archived is not None and (row[7] == ARCHIVE_FOLDER_ID) != self.archived:
+            return False
+        if self.inactive_days and row[5] >= self._cutoff():
+            return False
+        return True
+
+class DialogIndex:
+    """Per-account on-disk index of dialogs that have a title (groups and channels)"""
+
+    SCHEMA_VERSION = 3
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._init_schema()
+
+    @classmethod
+    def for_session(cls, session_string, directory=DIALOG_INDEX_DIR):
+        """Open the index belonging to the account of a session string"""
+        return cls(os.path.join(directory, f"{account_key(session_string)}.sqlite3"))
+
+    def _connect(self):
+        return closing(sqlite3.connect(self.path, timeout=30))
+
+    def _init_schema(self):
+        with self._connect() as conn, conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version == self.SCHEMA_VERSION:
+                return
+            # Older layouts are simply rebuilt from Telegram on the next refresh
+            conn.execute("DROP TABLE IF EXISTS dialogs")
+            conn.execute("DROP TABLE IF EXISTS meta")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS dialogs (
+                    id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    access_hash INTEGER,
+                    username TEXT,
+                    date INTEGER NOT NULL DEFAULT 0,
+                    kind TEXT NOT NULL DEFAULT 'broadcast',
+                    folder_id INTEGER NOT NULL DEFAULT 0,
+                    generation INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (type, id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS dialogs_date ON dialogs (date)")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value REAL NOT NULL)")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def _get_meta(self, conn, key, default=0.0):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, conn, key, value):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def synced_at(self):
+        """Unix time of the last successful refresh, 0 if the index was never built"""
+        with self._connect() as conn:
+            return self._get_meta(conn, "synced_at")
+
+    def is_fresh(self, max_age=DIALOG_INDEX_REFRESH_SECONDS):
+        return time.time() - self.synced_at < max_age
+
+    @staticmethod
+    def _row_from_dialog(dlg):
+        ent = dlg.entity
+        title = getattr(ent, 'title', '') or ''
+        if not title:
+            return None
+        date = int(dlg.date.timestamp()) if dlg.date else 0
+        return (
+            ent.id,
+            type(ent).__name__,
+            title,
+            getattr(ent, 'access_hash', None),
+            getattr(ent, 'username', None),
+            date,
+            dialog_kind(ent),
+            getattr(dlg, 'folder_id', None) or 0,
+        )
+
+    def needs_full_refresh(self):
+        """True if the next refresh has to re-download every dialog"""
+        synced_at = self.synced_at
+        return not synced_at or time.time() - synced_at > DIALOG_INDEX_MAX_AGE_SECONDS
+
+    async def refresh_pages(self, client, full=False, dialog_filter=None):
+        """Refresh the index, yielding each page of dialogs as DialogRecords once it is stored.
+
+        Dialogs come newest first, so an incremental refresh stops at the first
+        non-pinned dialog that is not newer than the previous sync. A full
+        rebuild is done on first use, when forced, or once the index is older
+        than DIALOG_INDEX_MAX_AGE_SECONDS (to forget groups left elsewhere).
+        Pages are written as they arrive, but the sync is only recorded (and,
+        for a full rebuild, dialogs that were not seen are only dropped) if
+        the caller iterates to the end. Every dialog is stored, but pages only
+        contain those accepted by dialog_filter. Database work runs in the
+        loop's executor, so an index locked by another process never stalls
+        the Telegram requests of other accounts sharing the loop.
+        """
+        loop = asyncio.get_running_loop()
+        if await loop.run_in_executor(None, self.needs_full_refresh):
+            full = True
+        high_date, generation = await loop.run_in_executor(None, self._start_refresh, full)
+
+        rows = []
+        newest = high_date
+        async for dlg in client.iter_dialogs():
+            date = int(dlg.date.timestamp()) if dlg.date else 0
+            if not full and not dlg.pinned and date <= high_date:
+                break
+            newest = max(newest, date)
+            row = self._row_from_dialog(dlg)
+            if row:
+                rows.append(row + (generation,))
+            if len(rows) >= DIALOG_PAGE_SIZE:
+                metrics.inc('dialogs_indexed_total', len(rows))
+                await loop.run_in_executor(None, self._write_rows, rows)
+                yield self._records_from_rows(rows, dialog_filter)
+                rows = []
+        if rows:
+            metrics.inc('dialogs_indexed_total', len(rows))
+            await loop.run_in_executor(None, self._write_rows, rows)
+            yield self._records_from_rows(rows, dialog_filter)
+
+        await loop.run_in_executor(None, self._finish_refresh, full, generation, newest)
+
+    def _start_refresh(self, full):
+        """Return the newest dialog date seen so far and the generation the refresh writes"""
+        with self._connect() as conn:
+            high_date = self._get_meta(conn, "high_date")
+            generation = int(self._get_meta(conn, "generation")) + (1 if full else 0)
+        return high_date, generation
+
+    def _finish_refresh(self, full, generation, newest):
+        with self._connect() as conn, conn:
+            if full:
+                conn.execute("DELETE FROM dialogs WHERE generation < ?", (generation,))
+            self._set_meta(conn, "synced_at", time.time())
+            self._set_meta(conn, "high_date", newest)
+            self._set_meta(conn, "generation", generation)
+
+    async def refresh(self, client, full=False):
+        """Bring the index up to date and return the number of dialogs written"""
+        written = 0
+        async for page in self.refresh_pages(client, full):
+            written += len(page)
+        return written
+
+    def _write_rows(self, rows):
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO dialogs (id, type, title, access_hash, username, date, kind, folder_id, "
+                "generation) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    @staticmethod
+    def _record_from_row(row):
+        return DialogRecord(row[0], row[2], row[1], row[3], row[4], row[5])
+
+    def _records_from_rows(self, rows, dialog_filter=None):
+        if dialog_filter:
+            rows = [row for row in rows if dialog_filter.accepts_row(row)]
+        return [self._record_from_row(row) for row in rows]
+
+    def all(self, dialog_filter=None):
+        """Return every indexed dialog (accepted by dialog_filter) as a DialogRecord, newest first"""
+        where, params = dialog_filter.where() if dialog_filter else ("1", [])
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, type, title, access_hash, username, date FROM dialogs WHERE {where} ORDER BY date DESC",
+                params
+            ).fetchall()
+        return [self._record_from_row(row) for row in rows]
+
+    def iter_pages(self, dialog_filter=None, page_size=DIALOG_PAGE_SIZE):
+        """Yield indexed dialogs (accepted by dialog_filter) in pages of DialogRecords, newest first,
+        without loading the whole index at once"""
+        where, params = dialog_filter.where() if dialog_filter else ("1", [])
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"SELECT id, type, title, access_hash, username, date FROM dialogs WHERE {where} ORDER BY date DESC",
+                params
+            )
+            while True:
+                rows = cursor.fetchmany(page_size)
+                if not rows:
+                    break
+                yield [self._record_from_row(row) for row in rows]
+
+    def search(self, matcher, dialog_filter=None):
+        """Return indexed dialogs accepted by a KeywordMatcher (or containing a single keyword)"""
+        if isinstance(matcher, str):
+            matcher = KeywordMatcher([matcher])
+        return matcher.classify(self.all(dialog_filter))
+
+    def set_folder(self, records, folder_id):
+        """Record that dialogs were moved to another folder (e.g. archived) by this tool"""
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "UPDATE dialogs SET folder_id = ? WHERE type = ? AND id = ?",
+                [(folder_id, *record.key) for record in records]
+            )
+
+    def remove(self, records):
+        """Drop dialogs that were left so later searches do not list them again"""
+        with self._connect() as conn, conn:
+            conn.executemany(
+                "DELETE FROM dialogs WHERE type = ? AND id = ?",
+                [record.key for record in records]
+            )
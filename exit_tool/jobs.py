@@ -0,0 +1,196 @@
+"""Durable leave jobs with a per-group write-ahead journal"""
+import asyncio
+import os
+import sqlite3
+import time
+from contextlib import closing
+
+from .config import LEAVE_CONCURRENCY, LEAVE_JOURNAL_DIR
+from .records import DialogRecord
+from .sessions import account_key
+
+PENDING = 'pending'
+RESOLVED = 'resolved'
+LEFT = 'left'
+FAILED = 'failed'
+
+class LeaveJournal:
+    """Per-account on-disk journal of leave jobs and the state of every group in them.
+
+    Each group moves pending -> resolved -> left (or failed, with the error).
+    "resolved" is written, together with the access_hash about to be used,
+    before the leave request is sent, so a job interrupted by a rerun, a
+    closed tab or a crash resumes without repeating lookups, and groups
+    already marked left are never sent again.
+    """
+
+    SCHEMA_VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._init_schema()
+
+    @classmethod
+    def for_session(cls, session_string, directory=LEAVE_JOURNAL_DIR):
+        """Open the journal belonging to the account of a session string"""
+        return cls(os.path.join(directory, f"{account_key(session_string)}.jobs.sqlite3"))
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        # WAL keeps every committed state change across a process crash without a full fsync per write
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return closing(conn)
+
+    def _init_schema(self):
+        with self._connect() as conn, conn:
+            conn.execute("PRAGMA journal_mode = WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, self.SCHEMA_VERSION):
+                raise RuntimeError(f"Unsupported leave journal version {version} in {self.path}")
+            if version == self.SCHEMA_VERSION:
+                # Opened on every rerun and poll, so an up-to-date journal is only read here
+                return
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at REAL NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS items (
+                    job_id INTEGER NOT NULL,
+                    seq INTEGER NOT NULL,
+                    id INTEGER NOT NULL,
+                    type TEXT NOT NULL,
+                    title TEXT NOT NULL,
+                    access_hash INTEGER,
+                    username TEXT,
+                    date INTEGER NOT NULL DEFAULT 0,
+                    matched_rules TEXT NOT NULL DEFAULT '',
+                    state TEXT NOT NULL DEFAULT 'pending',
+                    error TEXT,
+                    updated_at REAL NOT NULL,
+                    PRIMARY KEY (job_id, type, id)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS items_state ON items (job_id, state)")
+            conn.execute(f"PRAGMA user_version = {self.SCHEMA_VERSION}")
+
+    def create_job(self, records):
+        """Journal a new leave job for the given DialogRecords and return its id"""
+        now = time.time()
+        with self._connect() as conn, conn:
+            job_id = conn.execute("INSERT INTO jobs (created_at) VALUES (?)", (now,)).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO items (job_id, seq, id, type, title, access_hash, username, date, "
+                "matched_rules, state, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (job_id, seq, r.id, r.type, r.title, r.access_hash, r.username, r.date,
+                     "\n".join(r.matched_rules), PENDING, now)
+                    for seq, r in enumerate(records)
+                ]
+            )
+        return job_id
+
+    def _set_state(self, job_id, record, state, error=None):
+        with self._connect() as conn, conn:
+            conn.execute(
+                "UPDATE items SET state = ?, error = ?, updated_at = ? WHERE job_id = ? AND type = ? AND id = ?",
+                (state, error, time.time(), job_id, record.type, record.id)
+            )
+
+    def mark_resolved(self, job_id, record):
+        """Record the access_hash about to be used, before the leave request goes out"""
+        with self._connect() as conn, conn:
+            conn.execute(
+                "UPDATE items SET state = ?, error = NULL, access_hash = ?, updated_at = ? "
+                "WHERE job_id = ? AND type = ? AND id = ?",
+                (RESOLVED, record.access_hash, time.time(), job_id, record.type, record.id)
+            )
+
+    def mark_left(self, job_id, record):
+        self._set_state(job_id, record, LEFT)
+
+    def mark_failed(self, job_id, record, error):
+        self._set_state(job_id, record, FAILED, error)
+
+    @staticmethod
+    def _record_from_row(row):
+        return DialogRecord(row[0], row[2], row[1], row[3], row[4], row[5],
+                            tuple(row[6].split("\n")) if row[6] else ())
+
+    def records(self, job_id, states=(PENDING, RESOLVED)):
+        """Return the job's groups in the given states as DialogRecords, in their original order"""
+        placeholders = ", ".join("?" * len(states))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, type, title, access_hash, username, date, matched_rules FROM items "
+                f"WHERE job_id = ? AND state IN ({placeholders}) ORDER BY seq",
+                (job_id, *states)
+            ).fetchall()
+        return [self._record_from_row(row) for row in rows]
+
+    def failures(self, job_id):
+        """Return (record, error) for every group of the job that could not be left"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, type, title, access_hash, username, date, matched_rules, error FROM items "
+                "WHERE job_id = ? AND state = ? ORDER BY seq",
+                (job_id, FAILED)
+            ).fetchall()
+        return [(self._record_from_row(row), row[7]) for row in rows]
+
+    def status(self, job_id):
+        """Return {'job_id', 'created_at', 'total', <state>: count} for one job"""
+        with self._connect() as conn:
+            created = conn.execute("SELECT created_at FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+            if created is None:
+                raise KeyError(f"No leave job {job_id}")
+            counts = dict(conn.execute(
+                "SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state", (job_id,)
+            ).fetchall())
+        status = {'job_id': job_id, 'created_at': created[0], 'total': sum(counts.values())}
+        for state in (PENDING, RESOLVED, LEFT, FAILED):
+            status[state] = counts.get(state, 0)
+        return status
+
+    def unfinished_jobs(self):
+        """Return the status of every job that still has groups to leave, newest first"""
+        with self._connect() as conn:
+            job_ids = [row[0] for row in conn.execute(
+                "SELECT DISTINCT job_id FROM items WHERE state IN (?, ?) ORDER BY job_id DESC",
+                (PENDING, RESOLVED)
+            )]
+        return [self.status(job_id) for job_id in job_ids]
+
+    def discard(self, job_id):
+        """Forget a job, e.g. one the user no longer wants to resume"""
+        with self._connect() as conn, conn:
+            conn.execute("DELETE FROM items WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+
+async def run_leave_job(client, journal, job_id, concurrency=LEAVE_CONCURRENCY, retry_failed=False):
+    """Leave the remaining groups of a journaled job, yielding (entity_info, error) as each finishes.
+
+    Only groups still pending or resolved are attempted (plus failed ones if
+    retry_failed), so running the same job again after an interruption picks
+    up where it stopped. Every outcome is journaled as soon as its request
+    returns, so pausing never loses a leave that already happened. Journal
+    writes run in the loop's executor: a journal locked by another process
+    (a poll, or a CLI --resume) must not stall the requests of every account
+    sharing the loop.
+    """
+    from .leave import leave_groups_pipelined
+
+    loop = asyncio.get_running_loop()
+    states = (PENDING, RESOLVED, FAILED) if retry_failed else (PENDING, RESOLVED)
+    remaining = await loop.run_in_executor(None, journal.records, job_id, states)
+    results = leave_groups_pipelined(
+        client, remaining, concurrency,
+        on_resolved=lambda record: loop.run_in_executor(None, journal.mark_resolved, job_id, record),
+        on_left=lambda record: loop.run_in_executor(None, journal.mark_left, job_id, record),
+        on_failed=lambda record, error: loop.run_in_executor(None, journal.mark_failed, job_id, record, error)
+    )
+    async for entity_info, error in results:
+        yield entity_info, error
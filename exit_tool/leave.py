@@ -0,0 +1,162 @@
+"""Entity resolution and the pipelined leave engine"""
+import asyncio
+import logging
+import threading
+import time
+from collections import Counter
+
+from telethon.errors import ChannelInvalidError, ChatIdInvalidError, PeerIdInvalidError, UserNotParticipantError
+from telethon.tl.functions.channels import LeaveChannelRequest
+from telethon.tl.functions.messages import DeleteChatUserRequest
+from telethon.tl.types import PeerChannel, PeerChat, InputChannel, InputPeerChannel, InputPeerChat, InputUserSelf
+
+from .config import LEAVE_CONCURRENCY
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# How entities were resolved before leaving, to see how often network fallbacks happen
+resolution_stats = Counter()
+_resolution_stats_lock = threading.Lock()
+
+def record_resolution(path):
+    with _resolution_stats_lock:
+        resolution_stats[path] += 1
+    metrics.inc('entity_resolutions_total', path=path)
+
+def input_peer_from_info(entity_info):
+    """Build an input peer from the stored id and access_hash without any network call"""
+    if entity_info.type == 'Channel' and entity_info.access_hash is not None:
+        return InputPeerChannel(entity_info.id, entity_info.access_hash)
+    if entity_info.type == 'Chat':
+        return InputPeerChat(entity_info.id)
+    return None
+
+async def _resolve_entity_remote(client, entity_info):
+    """Look the entity up on Telegram, trying username, typed peer and bare id in turn"""
+    entity_id = entity_info.id
+    entity_type = entity_info.type
+    username = entity_info.username
+    
+    # Method 1: Try by username if available
+    if username:
+        try:
+            entity = await client.get_entity(username)
+            record_resolution('username')
+            return entity
+        except:
+            pass
+    
+    # Method 2: Try by typed peer id
+    try:
+        if entity_type == 'Channel':
+            entity = await client.get_entity(PeerChannel(entity_id))
+            record_resolution('peer')
+            return entity
+        elif entity_type == 'Chat':
+            entity = await client.get_entity(PeerChat(entity_id))
+            record_resolution('peer')
+            return entity
+    except:
+        pass
+    
+    # Method 3: Try by just ID as fallback
+    try:
+        entity = await client.get_entity(entity_id)
+        record_resolution('id')
+        return entity
+    except:
+        pass
+    
+    record_resolution('unresolved')
+    raise Exception(f"Could not resolve entity: {entity_info.title}")
+
+async def _leave_entity(client, entity_info, on_resolved=None):
+    """Resolve and leave one entity, raising on failure.
+
+    The stored access_hash is used directly, so the common case costs exactly
+    one RPC. Network lookups only happen if Telegram rejects the cached peer.
+    on_resolved, if given, is called with the record (carrying the access_hash
+    about to be used) and awaited right before each leave request is sent.
+    """
+    entity_type = entity_info.type
+    peer = input_peer_from_info(entity_info)
+    
+    if peer is not None:
+        try:
+            if on_resolved:
+                await on_resolved(entity_info)
+            if entity_type == 'Channel':
+                await client(LeaveChannelRequest(InputChannel(peer.channel_id, peer.access_hash)))
+            else:
+                await client(DeleteChatUserRequest(peer.chat_id, InputUserSelf()))
+            record_resolution('cached')
+            return
+        except (ChannelInvalidError, ChatIdInvalidError, PeerIdInvalidError):
+            record_resolution('cached_rejected')
+    
+    entity = await _resolve_entity_remote(client, entity_info)
+    if on_resolved:
+        await on_resolved(entity_info.with_access_hash(getattr(entity, 'access_hash', entity_info.access_hash)))
+    
+    # Leave the entity
+    if entity_type == 'Channel':
+        await client(LeaveChannelRequest(entity))
+    elif entity_type == 'Chat':
+        await client(DeleteChatUserRequest(entity.id, 'me'))
+
+async def leave_entity_by_info(client, entity_info):
+    """Leave entity using comprehensive entity information"""
+    try:
+        await _leave_entity(client, entity_info)
+        return True
+    except UserNotParticipantError:
+        return True
+    except Exception as e:
+        logger.warning("Error leaving %s: %s", entity_info.title, e)
+        return False
+
+async def leave_groups_pipelined(client, entity_infos, concurrency=LEAVE_CONCURRENCY, on_resolved=None,
+                                 on_left=None, on_failed=None):
+    """Leave many entities concurrently, yielding (entity_info, error) as each one finishes.
+
+    Up to `concurrency` groups are in progress at once, so entities for upcoming
+    groups are resolved while earlier leave RPCs are still in flight. The
+    client's RateScheduler still bounds the overall request rate. error is
+    None on success, including for groups the account had already left.
+    on_left(entity_info) and on_failed(entity_info, error) are called and
+    awaited as soon as each request returns, so outcomes are recorded even
+    for groups whose results are never consumed because iteration stopped
+    early.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def _leave(entity_info):
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await _leave_entity(client, entity_info, on_resolved)
+                metrics.inc('leave_results_total', result='left')
+            except UserNotParticipantError:
+                # Left before (e.g. by an interrupted run), so there is nothing to redo
+                metrics.inc('leave_results_total', result='already_left')
+            except Exception as e:
+                metrics.inc('leave_results_total', result='failed')
+                metrics.inc('leave_errors_total', error=type(e).__name__)
+                if on_failed:
+                    await on_failed(entity_info, str(e))
+                return entity_info, str(e)
+            finally:
+                metrics.observe('leave_seconds', time.monotonic() - started)
+            if on_left:
+                await on_left(entity_info)
+            return entity_info, None
+    
+    tasks = [asyncio.ensure_future(_leave(info)) for info in entity_infos]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # Stop outstanding work if the consumer stops iterating early
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,120 @@
+"""Keyword, regex and exclusion matching of dialog titles"""
+import re
+import unicodedata
+
+# Look-alike characters used to disguise spam titles, folded to the Latin letter they imitate
+_CONFUSABLES = str.maketrans({
+    # Cyrillic
+    'А': 'a', 'а': 'a', 'В': 'b', 'Е': 'e', 'е': 'e', 'Ё': 'e', 'ё': 'e', 'К': 'k', 'к': 'k',
+    'М': 'm', 'Н': 'h', 'О': 'o', 'о': 'o', 'Р': 'p', 'р': 'p', 'С': 'c', 'с': 'c',
+    'Т': 't', 'У': 'y', 'у': 'y', 'Х': 'x', 'х': 'x', 'Ѕ': 's', 'ѕ': 's', 'І': 'i', 'і': 'i',
+    'Ј': 'j', 'ј': 'j', 'ԁ': 'd', 'ԛ': 'q', 'ԝ': 'w', 'ɡ': 'g',
+    # Greek
+    'Α': 'a', 'α': 'a', 'Β': 'b', 'Ε': 'e', 'ε': 'e', 'Ζ': 'z', 'Η': 'h', 'Ι': 'i', 'ι': 'i',
+    'Κ': 'k', 'κ': 'k', 'Μ': 'm', 'Ν': 'n', 'ν': 'v', 'Ο': 'o', 'ο': 'o', 'Ρ': 'p', 'ρ': 'p',
+    'Τ': 't', 'τ': 't', 'Υ': 'y', 'υ': 'u', 'Χ': 'x', 'χ': 'x',
+    # Latin variants and digit/symbol substitutions
+    'ı': 'i', 'ℓ': 'l', '0': 'o', '1': 'i', '3': 'e', '4': 'a', '5': 's', '7': 't', '@': 'a', '$': 's',
+})
+
+def normalize_title(text):
+    """Fold text for spam-resistant matching.
+
+    Applies NFKC (fullwidth and styled letters), maps look-alike characters
+    to Latin, casefolds, strips accents and drops everything that is not a
+    letter or digit, so "🔥Ⅽаѕ1nо🔥" and "C A S I N O" both become "casino".
+    """
+    text = unicodedata.normalize('NFKC', text).translate(_CONFUSABLES).casefold()
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(ch for ch in text if ch.isalnum() and not unicodedata.combining(ch))
+
+def split_terms(text):
+    """Split user input on newlines and commas into a list of non-empty terms"""
+    return [t.strip() for t in re.split(r"[\n,]", text or "") if t.strip()]
+
+class KeywordMatcher:
+    """Classify many titles against keywords, regexes and exclusion terms in one pass.
+
+    Keywords and exclusion terms are compiled into a single Aho-Corasick
+    automaton over casefolded text (or, with normalize=True, text folded by
+    normalize_title), so the cost of matching a title does not grow with the
+    number of keywords. Regexes are matched case-insensitively against the
+    original title.
+    """
+
+    def __init__(self, keywords=(), patterns=(), exclude=(), normalize=False):
+        self.keywords = list(dict.fromkeys(k for k in keywords if k))
+        self.exclude = list(dict.fromkeys(k for k in exclude if k))
+        self.patterns = [(p, re.compile(p, re.IGNORECASE)) for p in dict.fromkeys(p for p in patterns if p)]
+        self._rule_sets = {}
+        self._fold = normalize_title if normalize else str.casefold
+
+        # Term ids below len(self.keywords) are keywords, the rest are exclusions
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [()]
+        for term_id, term in enumerate(self.keywords + self.exclude):
+            folded = self._fold(term)
+            if folded:
+                self._add(folded, term_id)
+        self._build()
+
+    def __bool__(self):
+        return bool(self.keywords or self.patterns)
+
+    def _add(self, term, term_id):
+        state = 0
+        for ch in term:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            state = nxt
+        self._out[state] = self._out[state] + (term_id,)
+
+    def _build(self):
+        queue = list(self._goto[0].values())
+        for state in queue:
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fail = self._fail[state]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[nxt] = self._goto[fail].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _scan(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        hits = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                hits.update(out[state])
+        return hits
+
+    def match(self, title):
+        """Return the rules that match title, or an empty list if none match or it is excluded"""
+        hits = self._scan(self._fold(title))
+        n_keywords = len(self.keywords)
+        if any(term_id >= n_keywords for term_id in hits):
+            return []
+        rules = [self.keywords[term_id] for term_id in sorted(hits)]
+        rules.extend(p for p, rx in self.patterns if rx.search(title))
+        return rules
+
+    def classify(self, records):
+        """Return copies of the matching DialogRecords annotated with their matched_rules"""
+        matches = []
+        for record in records:
+            rules = self.match(record.title)
+            if rules:
+                # Groups matching the same rules share one tuple
+                rules = self._rule_sets.setdefault(tuple(rules), tuple(rules))
+                matches.append(record.with_rules(rules))
+        return matches
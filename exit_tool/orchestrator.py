@@ -0,0 +1,98 @@
+"""Run search-and-leave cleanups for many accounts at once"""
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from .config import LEAVE_CONCURRENCY
+from .index import DialogIndex
+from .jobs import LeaveJournal, run_leave_job
+from .matching import KeywordMatcher
+from .timeouts import connect_with_retries, timeout_policy
+
+async def run_account(label, session_string, api_id, api_hash, keywords, patterns=(), exclude=(),
+                      leave=False, concurrency=LEAVE_CONCURRENCY, full_refresh=False, normalize=False,
+                      dialog_filter=None):
+    """Search (and optionally leave) the matching groups of one account and return its report.
+
+    Telegram is only contacted when the account's index needs refreshing or
+    groups are being left. Requests are paced by the account's own
+    RateScheduler, so accounts never slow each other down. Leaving runs as a
+    journaled job, so an interrupted batch can be finished per account with
+    `leave --resume`.
+    """
+    started = time.monotonic()
+    report = {'account': label, 'matches': 0, 'left': [], 'failed': [], 'error': None}
+    index = DialogIndex.for_session(session_string)
+    matcher = KeywordMatcher(keywords, patterns, exclude, normalize=normalize)
+    needs_refresh = full_refresh or not index.is_fresh()
+    left_groups = []
+
+    try:
+        if not needs_refresh and not leave:
+            report['matches'] = len(index.search(matcher, dialog_filter))
+            return report
+
+        from .client import new_client
+
+        client = new_client(api_id, api_hash, session_string)
+        await connect_with_retries(client, client.scheduler.timeouts or timeout_policy, purpose='batch')
+        try:
+            if not await client.is_user_authorized():
+                raise RuntimeError("session is not authorized")
+            if needs_refresh:
+                await index.refresh(client, full=full_refresh)
+            groups = index.search(matcher, dialog_filter)
+            report['matches'] = len(groups)
+            if leave:
+                journal = LeaveJournal.for_session(session_string)
+                report['job_id'] = job_id = journal.create_job(groups)
+                async for entity_info, error in run_leave_job(client, journal, job_id, concurrency):
+                    summary = {'id': entity_info.id, 'title': entity_info.title, 'type': entity_info.type}
+                    if error:
+                        report['failed'].append({**summary, 'error': error})
+                    else:
+                        report['left'].append(summary)
+                        left_groups.append(entity_info)
+        finally:
+            await client.disconnect()
+            index.remove(left_groups)
+    except Exception as e:
+        report['error'] = str(e)
+    finally:
+        report['elapsed'] = round(time.monotonic() - started, 3)
+    return report
+
+async def run_accounts(accounts, max_parallel=None, **options):
+    """Run run_account for every (label, session_string) pair concurrently on one loop"""
+    semaphore = asyncio.Semaphore(max_parallel) if max_parallel else None
+
+    async def _run(label, session_string):
+        if semaphore is None:
+            return await run_account(label, session_string, **options)
+        async with semaphore:
+            return await run_account(label, session_string, **options)
+
+    return await asyncio.gather(*(_run(label, s) for label, s in accounts))
+
+def _run_chunk(accounts, max_parallel, options):
+    return asyncio.run(run_accounts(accounts, max_parallel, **options))
+
+def run_accounts_sync(accounts, processes=1, max_parallel=None, **options):
+    """Run a multi-account cleanup, optionally spreading accounts across worker processes.
+
+    Accounts are dealt round-robin to `processes` workers, each running its
+    share on a single event loop. Reports come back in input order.
+    """
+    accounts = list(accounts)
+    processes = max(1, min(processes, len(accounts)))
+    if processes == 1:
+        return _run_chunk(accounts, max_parallel, options)
+
+    chunks = [accounts[i::processes] for i in range(processes)]
+    with ProcessPoolExecutor(processes) as pool:
+        results = list(pool.map(partial(_run_chunk, max_parallel=max_parallel, options=options), chunks))
+    reports = [None] * len(accounts)
+    for i, chunk_reports in enumerate(results):
+        reports[i::processes] = chunk_reports
+    return reports
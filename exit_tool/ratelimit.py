@@ -0,0 +1,145 @@
+"""Per-account adaptive rate limiting for Telegram requests"""
+import asyncio
+import threading
+import time
+
+from .config import (
+    RPC_RATE_INITIAL, RPC_RATE_MIN, RPC_RATE_MAX, RPC_BURST, MAX_FLOOD_WAIT_SECONDS
+)
+from .metrics import metrics
+from .sessions import account_key
+from .timeouts import run_with_deadline, timeout_policy
+
+class RateScheduler:
+    """Adaptive token bucket shared by every RPC made for one account.
+
+    The rate grows additively while calls succeed and is cut multiplicatively
+    on FloodWaitError, at which point all callers pause for the requested
+    number of seconds before the failed call is retried. The bucket is only
+    touched under a threading lock and never awaits while holding it, so one
+    instance can be shared by clients running on different event loops.
+    With a TimeoutPolicy (timeouts), every attempt also gets a deadline and
+    slow reads may be hedged using spare tokens.
+    """
+
+    def __init__(self, rate=RPC_RATE_INITIAL, min_rate=RPC_RATE_MIN, max_rate=RPC_RATE_MAX,
+                 burst=RPC_BURST, increase=0.1, decrease=0.5,
+                 max_flood_wait=MAX_FLOOD_WAIT_SECONDS, max_retries=5, timeouts=None):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.increase = increase
+        self.decrease = decrease
+        self.max_flood_wait = max_flood_wait
+        self.max_retries = max_retries
+        self.timeouts = timeouts
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        """Take one token and return how long the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            self._tokens -= 1
+            # _updated lies in the future while a flood wait is in effect
+            wait = self._updated - now
+            if self._tokens < 0:
+                wait += -self._tokens / self.rate
+            return wait
+
+    def _try_reserve(self):
+        """Take a token only if one is available right now"""
+        with self._lock:
+            now = time.monotonic()
+            if now > self._updated:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+            if self._updated > now or self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def on_flood_wait(self, seconds):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._tokens = 0.0
+            self._updated = max(self._updated, time.monotonic() + seconds)
+
+    async def run(self, call, name="request", on_stall=None):
+        """Await call() under the rate limit, retrying it after flood waits and timeouts.
+
+        Time spent waiting for a token, the latency of every attempt and all
+        flood waits, timeouts and retries are recorded in metrics under
+        `name`. After a timeout, on_stall(started) is awaited before the
+        retry, e.g. to reconnect a connection that stopped answering.
+        """
+        from telethon.errors import FloodWaitError
+
+        attempt = 0
+        stalls = 0
+        while True:
+            queued = time.monotonic()
+            await self.acquire()
+            started = time.monotonic()
+            metrics.observe('scheduler_wait_seconds', started - queued)
+            try:
+                if self.timeouts is None:
+                    result = await call()
+                else:
+                    result = await run_with_deadline(call, name, self.timeouts, self._try_reserve)
+            except asyncio.TimeoutError:
+                metrics.observe('rpc_latency_seconds', time.monotonic() - started, rpc=name, outcome='timeout')
+                metrics.inc('rpc_timeouts_total', rpc=name)
+                if self.timeouts is None or stalls >= self.timeouts.retries_for(name):
+                    raise
+                metrics.inc('rpc_retries_total', rpc=name)
+                if on_stall is not None:
+                    await on_stall(started)
+                await asyncio.sleep(self.timeouts.backoff_delay(stalls))
+                stalls += 1
+                continue
+            except FloodWaitError as e:
+                metrics.observe('rpc_latency_seconds', time.monotonic() - started, rpc=name, outcome='flood_wait')
+                metrics.inc('flood_waits_total', rpc=name)
+                metrics.inc('flood_wait_seconds_total', e.seconds, rpc=name)
+                attempt += 1
+                if e.seconds > self.max_flood_wait or attempt > self.max_retries:
+                    raise
+                metrics.inc('rpc_retries_total', rpc=name)
+                self.on_flood_wait(e.seconds)
+                continue
+            except Exception as e:
+                metrics.observe('rpc_latency_seconds', time.monotonic() - started, rpc=name, outcome='error')
+                metrics.inc('rpc_errors_total', rpc=name, error=type(e).__name__)
+                raise
+            latency = time.monotonic() - started
+            metrics.observe('rpc_latency_seconds', latency, rpc=name, outcome='ok')
+            if self.timeouts is not None:
+                self.timeouts.observe(name, latency)
+            self.on_success()
+            return result
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(session_string):
+    """Return the RateScheduler shared by all clients of the account behind session_string"""
+    key = account_key(session_string)
+    with _schedulers_lock:
+        if key not in _schedulers:
+            _schedulers[key] = RateScheduler(timeouts=timeout_policy)
+        return _schedulers[key]
@@ -0,0 +1,86 @@
+"""Compact in-memory records for dialogs and search matches"""
+import sys
+
+class DialogRecord:
+    """One titled dialog (group, channel or basic chat), optionally with the rules it matched.
+
+    Uses __slots__ and interned type names so that tens of thousands of
+    records per session stay small, and computes its display label only
+    when first asked for it.
+    """
+
+    __slots__ = ('id', 'title', 'type', 'access_hash', 'username', 'date', 'matched_rules', '_label')
+
+    def __init__(self, id, title, type, access_hash=None, username=None, date=0, matched_rules=()):
+        self.id = id
+        self.title = title
+        self.type = sys.intern(type)
+        self.access_hash = access_hash
+        self.username = username
+        self.date = date
+        self.matched_rules = matched_rules
+        self._label = None
+
+    def __repr__(self):
+        return f"DialogRecord({self.type} {self.id} {self.title!r})"
+
+    @property
+    def key(self):
+        """Identity of the dialog; ids of channels and basic chats can collide"""
+        return (self.type, self.id)
+
+    @property
+    def label(self):
+        if self._label is None:
+            label = f"{self.title} ({self.type})"
+            if self.matched_rules:
+                label += f" · {', '.join(self.matched_rules)}"
+            self._label = label
+        return self._label
+
+    def with_rules(self, matched_rules):
+        """Return a copy of this record annotated with the rules it matched"""
+        return DialogRecord(self.id, self.title, self.type, self.access_hash,
+                            self.username, self.date, matched_rules)
+
+    def with_access_hash(self, access_hash):
+        """Return a copy of this record carrying a freshly resolved access_hash"""
+        return DialogRecord(self.id, self.title, self.type, access_hash,
+                            self.username, self.date, self.matched_rules)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'type': self.type,
+            'access_hash': self.access_hash,
+            'username': self.username,
+            'date': self.date,
+            'matched_rules': list(self.matched_rules),
+        }
+
+class GroupInfo:
+    """Details of a group that are only available from its full chat info"""
+
+    __slots__ = ('members', 'is_admin', 'is_creator', 'is_forum', 'linked_chat_id', 'fetched_at')
+
+    def __init__(self, members=None, is_admin=False, is_creator=False, is_forum=False, linked_chat_id=None,
+                 fetched_at=0.0):
+        self.members = members
+        self.is_admin = is_admin
+        self.is_creator = is_creator
+        self.is_forum = is_forum
+        self.linked_chat_id = linked_chat_id
+        self.fetched_at = fetched_at
+
+    def __repr__(self):
+        return f"GroupInfo(members={self.members}, admin={self.is_admin}, forum={self.is_forum})"
+
+    def to_dict(self):
+        return {
+            'members': self.members,
+            'is_admin': self.is_admin,
+            'is_creator': self.is_creator,
+            'is_forum': self.is_forum,
+            'linked_chat_id': self.linked_chat_id,
+        }
@@ -0,0 +1,78 @@
+"""Keyword search over the local dialog index"""
+from .index import DialogIndex
+from .matching import KeywordMatcher
+
+async def iter_search(client, index, matcher, full_refresh=False, dialog_filter=None):
+    """Refresh the index from Telegram, yielding (scanned, new_matches) along the way.
+
+    A full rebuild streams the matches of every page of dialogs as it
+    arrives. An incremental refresh only fetches the newest dialogs, after
+    which all matches come from the index in one go. Only dialogs accepted
+    by dialog_filter are counted and matched.
+    """
+    if full_refresh or index.needs_full_refresh():
+        scanned = 0
+        async for page in index.refresh_pages(client, full=True, dialog_filter=dialog_filter):
+            scanned += len(page)
+            yield scanned, matcher.classify(page)
+    else:
+        await index.refresh(client)
+        infos = index.all(dialog_filter)
+        yield len(infos), matcher.classify(infos)
+
+def stream_target_groups(api_id, api_hash, keywords, session_string=None, force_refresh=False,
+                         patterns=(), exclude=(), manager=None, max_matches=None, normalize=False,
+                         dialog_filter=None):
+    """Yield (scanned, new_matches) for a search as results become available.
+
+    Telegram is only contacted (through manager, or the process-wide
+    ClientManager) when the index needs refreshing, so searches against a
+    fresh index never import or connect telethon. Closing the generator, or
+    reaching max_matches, stops the dialog scan early. dialog_filter (a
+    DialogFilter) narrows the dialogs by kind, folder and activity before
+    any title is matched.
+    """
+    if isinstance(keywords, str):
+        keywords = [keywords]
+    matcher = KeywordMatcher(keywords, patterns, exclude, normalize=normalize)
+    index = DialogIndex.for_session(session_string)
+
+    def _from_index():
+        infos = index.all(dialog_filter)
+        yield len(infos), matcher.classify(infos)
+
+    if not force_refresh and index.is_fresh():
+        pages = _from_index()
+    else:
+        if manager is None:
+            from .client import default_manager
+            manager = default_manager()
+        pages = manager.stream(
+            api_id, api_hash, session_string,
+            lambda client: iter_search(client, index, matcher, force_refresh, dialog_filter)
+        )
+
+    found = 0
+    try:
+        for scanned, matches in pages:
+            if max_matches:
+                matches = matches[:max_matches - found]
+            found += len(matches)
+            yield scanned, matches
+            if max_matches and found >= max_matches:
+                break
+    finally:
+        pages.close()
+
+def get_target_groups_sync(api_id, api_hash, keywords, session_string=None, force_refresh=False,
+                           patterns=(), exclude=(), manager=None, max_matches=None, normalize=False,
+                           dialog_filter=None):
+    """Search the local dialog index, refreshing it from Telegram only when stale"""
+    return [
+        match
+        for _, matches in stream_target_groups(
+            api_id, api_hash, keywords, session_string, force_refresh,
+            patterns, exclude, manager, max_matches, normalize, dialog_filter
+        )
+        for match in matches
+    ]
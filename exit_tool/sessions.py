@@ -0,0 +1,99 @@
+"""Helpers for identifying the account behind a Telegram session, and an encrypted store of sessions"""
+import base64
+import hashlib
+import json
+import logging
+import os
+import time
+
+from .config import SESSION_STORE_DIR, SESSION_STORE_KEY
+
+logger = logging.getLogger(__name__)
+
+def account_key(session_string):
+    """Stable, non-reversible key identifying the account behind a session string"""
+    return hashlib.sha256((session_string or "").encode()).hexdigest()[:16]
+
+def phone_key(phone):
+    """Stable, non-reversible key for a phone number, ignoring spaces, dashes and the leading +"""
+    digits = "".join(c for c in phone or "" if c.isdigit())
+    return hashlib.sha256(digits.encode()).hexdigest()[:16]
+
+def _require_fernet():
+    try:
+        from cryptography.fernet import Fernet, InvalidToken
+        return Fernet, InvalidToken
+    except ImportError:
+        raise RuntimeError("Saved logins need cryptography (pip install cryptography)") from None
+
+class SessionStore:
+    """Logged-in session strings kept on disk, encrypted, one file per phone number.
+
+    A session string grants full access to the account, so each file is
+    encrypted with a key only its owner can reproduce: scrypt over the
+    passphrase chosen at login (plus the server's SESSION_STORE_KEY), with
+    a random salt stored in the file. Knowing the phone number is not
+    enough to restore a login, and a wrong passphrase looks exactly like no
+    saved login at all. Nothing is stored unless SESSION_STORE_KEY is set.
+    The dialog index, leave journals and group info cache are keyed by the
+    session string, so a restored session finds its cached data again.
+    """
+
+    MIN_PASSPHRASE_LENGTH = 8
+    SALT_BYTES = 16
+
+    def __init__(self, directory=SESSION_STORE_DIR, secret=SESSION_STORE_KEY):
+        if not secret:
+            raise RuntimeError("Saved logins are disabled; set SESSION_STORE_KEY to enable them")
+        self._fernet, self._invalid_token = _require_fernet()
+        self.directory = directory
+        self._secret = secret
+        os.makedirs(directory, exist_ok=True)
+
+    def _cipher(self, passphrase, salt):
+        material = f"{self._secret}\0{passphrase}".encode()
+        key = hashlib.scrypt(material, salt=salt, n=2 ** 14, r=8, p=1, dklen=32)
+        return self._fernet(base64.urlsafe_b64encode(key))
+
+    @staticmethod
+    def _write(path, data):
+        """Write data atomically, readable by the owner only"""
+        temp_path = f"{path}.tmp"
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _path(self, phone):
+        return os.path.join(self.directory, f"{phone_key(phone)}.session")
+
+    def load(self, phone, passphrase):
+        """Return the session string saved for phone under passphrase, or None"""
+        if not passphrase:
+            return None
+        try:
+            with open(self._path(phone), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        salt, token = data[:self.SALT_BYTES], data[self.SALT_BYTES:]
+        try:
+            return json.loads(self._cipher(passphrase, salt).decrypt(token))['session']
+        except (self._invalid_token, ValueError, KeyError):
+            logger.info("Saved session could not be decrypted (wrong passphrase or server key)")
+            return None
+
+    def save(self, phone, passphrase, session_string):
+        """Encrypt the session string for phone under passphrase, replacing any earlier one"""
+        if len(passphrase or "") < self.MIN_PASSPHRASE_LENGTH:
+            raise ValueError(f"The passphrase needs at least {self.MIN_PASSPHRASE_LENGTH} characters")
+        salt = os.urandom(self.SALT_BYTES)
+        payload = json.dumps({'session': session_string, 'saved_at': time.time()}).encode()
+        self._write(self._path(phone), salt + self._cipher(passphrase, salt).encrypt(payload))
+
+    def delete(self, phone):
+        """Forget the saved session for phone (e.g. after it was revoked)"""
+        try:
+            os.remove(self._path(phone))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,189 @@
+"""Streaming export and import of dialog snapshots (CSV, JSON lines, Parquet, Arrow IPC)"""
+import csv
+import json
+import os
+import time
+
+from .records import DialogRecord
+
+FORMATS = ('csv', 'jsonl', 'parquet', 'arrow')
+
+_EXTENSIONS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.ipc': 'arrow',
+}
+
+COLUMNS = ('account', 'snapshot_at', 'id', 'type', 'title', 'access_hash', 'username', 'date', 'matched_rules')
+
+# matched_rules are joined with this in CSV, which has no list type
+RULE_SEPARATOR = " | "
+
+# Rows per Arrow record batch (and Parquet row group)
+ARROW_BATCH_ROWS = 10000
+
+def snapshot_format(path, format=None):
+    """Return the snapshot format for path, from format if given or else the file extension"""
+    if format:
+        if format not in FORMATS:
+            raise ValueError(f"Unknown snapshot format {format!r}, expected one of {', '.join(FORMATS)}")
+        return format
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in _EXTENSIONS:
+        raise ValueError(f"Cannot tell the snapshot format of {path!r}, pass one of {', '.join(FORMATS)}")
+    return _EXTENSIONS[extension]
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow snapshots need pyarrow (pip install pyarrow)") from None
+
+def _arrow_schema(pa):
+    return pa.schema([
+        ('account', pa.string()),
+        ('snapshot_at', pa.float64()),
+        ('id', pa.int64()),
+        ('type', pa.string()),
+        ('title', pa.string()),
+        ('access_hash', pa.int64()),
+        ('username', pa.string()),
+        ('date', pa.int64()),
+        ('matched_rules', pa.list_(pa.string())),
+    ])
+
+class _CsvWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8", newline="")
+        self._writer = csv.writer(self._file)
+        self._writer.writerow(COLUMNS)
+
+    def write(self, rows):
+        self._writer.writerows(
+            [*row[:-1], RULE_SEPARATOR.join(row[-1])] for row in rows
+        )
+
+    def close(self):
+        self._file.close()
+
+class _JsonlWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, rows):
+        self._file.writelines(
+            json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+        )
+
+    def close(self):
+        self._file.close()
+
+class _ArrowWriter:
+    """Buffers pages into record batches of batch_rows rows, so memory stays bounded
+    while Parquet row groups stay large enough to compress and scan well"""
+
+    def __init__(self, path, format, batch_rows=ARROW_BATCH_ROWS):
+        pa = self._pa = _require_pyarrow()
+        self._schema = _arrow_schema(pa)
+        self._batch_rows = batch_rows
+        self._pending = []
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            self._writer = pq.ParquetWriter(path, self._schema)
+        else:
+            self._writer = pa.ipc.new_file(path, self._schema)
+
+    def _flush(self):
+        columns = list(zip(*self._pending))
+        self._writer.write_batch(self._pa.RecordBatch.from_arrays(
+            [self._pa.array(column, type=field.type) for column, field in zip(columns, self._schema)],
+            schema=self._schema
+        ))
+        self._pending = []
+
+    def write(self, rows):
+        self._pending.extend(rows)
+        if len(self._pending) >= self._batch_rows:
+            self._flush()
+
+    def close(self):
+        try:
+            if self._pending:
+                self._flush()
+        finally:
+            self._writer.close()
+
+def write_snapshot(pages, path, format=None, account=None):
+    """Stream pages (iterables of DialogRecords) to a snapshot file and return the number written.
+
+    Only one page is held at a time, so a scan can be written out as it
+    runs. account (see sessions.account_key) and the snapshot time are
+    stored on every row, so snapshots of many accounts or days can be
+    concatenated and compared.
+    """
+    format = snapshot_format(path, format)
+    snapshot_at = time.time()
+    writer = _ArrowWriter(path, format) if format in ('parquet', 'arrow') else (
+        _CsvWriter(path) if format == 'csv' else _JsonlWriter(path)
+    )
+    written = 0
+    try:
+        for page in pages:
+            rows = [
+                (account, snapshot_at, r.id, r.type, r.title, r.access_hash, r.username, r.date,
+                 list(r.matched_rules))
+                for r in page
+            ]
+            if rows:
+                writer.write(rows)
+                written += len(rows)
+    finally:
+        writer.close()
+    return written
+
+def _optional_int(value):
+    return int(value) if value not in (None, "") else None
+
+def _iter_rows(path, format):
+    """Yield snapshot rows as dicts, one at a time (or one record batch at a time for Arrow)"""
+    if format == 'csv':
+        with open(path, encoding="utf-8", newline="") as f:
+            for row in csv.DictReader(f):
+                row['matched_rules'] = row['matched_rules'].split(RULE_SEPARATOR) if row['matched_rules'] else []
+                yield row
+    elif format == 'jsonl':
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        pa = _require_pyarrow()
+        if format == 'parquet':
+            import pyarrow.parquet as pq
+            batches = pq.ParquetFile(path).iter_batches()
+        else:
+            reader = pa.ipc.open_file(path)
+            batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+        for batch in batches:
+            yield from batch.to_pylist()
+
+def read_snapshot(path, format=None, account=None):
+    """Yield the DialogRecords stored in a snapshot file without loading it all at once.
+
+    If account is given, rows saved for a different account raise
+    ValueError: their access hashes are only valid for the account that
+    exported them.
+    """
+    for row in _iter_rows(path, snapshot_format(path, format)):
+        if account and row.get('account') and row['account'] != account:
+            raise ValueError(f"{path} was exported for another account")
+        yield DialogRecord(
+            int(row['id']), row['title'], row['type'], _optional_int(row.get('access_hash')),
+            row.get('username') or None, _optional_int(row.get('date')) or 0,
+            tuple(row.get('matched_rules') or ())
+        )
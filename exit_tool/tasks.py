@@ -0,0 +1,181 @@
+"""Background tasks that a UI can poll instead of blocking on long operations"""
+import threading
+import time
+from collections import deque
+
+from .config import TASK_WORKERS, TASKS_PER_OWNER
+from .metrics import metrics
+
+class BackgroundTask:
+    """Drains an iterable on a daemon thread, collecting its items for polling.
+
+    Streamlit fragments read items, done and error on a timer, so a
+    ten-minute search or leave run never blocks the script thread and its
+    progress never reruns the whole page. The iterable is only started on
+    the worker thread. cancel() stops after the item currently in progress
+    and closes the iterable, which stops the underlying Telegram work.
+    With start=False the task waits for a TaskQueue worker to run it.
+    """
+
+    def __init__(self, iterable, name="task", start=True):
+        self.name = name
+        self.items = []
+        self.error = None
+        self.cancelled = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._iterable = iterable
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        if start:
+            threading.Thread(target=self._run, name=f"background-{name}", daemon=True).start()
+
+    def _claim(self):
+        """Mark the task as started; False if it was cancelled while still queued"""
+        with self._lock:
+            if self._finished.is_set():
+                return False
+            self.started_at = time.time()
+            return True
+
+    def _run(self):
+        if not self._claim():
+            return
+        iterator = iter(self._iterable)
+        try:
+            for item in iterator:
+                # list.append is atomic, so pollers can read items without a lock
+                self.items.append(item)
+                if self._stop.is_set():
+                    self.cancelled = True
+                    break
+        except Exception as e:
+            self.error = e
+        finally:
+            close = getattr(iterator, 'close', None)
+            if close is not None:
+                close()
+            self.finished_at = time.time()
+            self._finished.set()
+
+    @property
+    def queued(self):
+        return self.started_at is None and not self.done
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    @property
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.time()) - self.started_at
+
+    def cancel(self):
+        """Ask the task to stop after the item currently being produced (or drop it if still queued)"""
+        with self._lock:
+            self._stop.set()
+            if self.started_at is None and not self._finished.is_set():
+                self.cancelled = True
+                self.finished_at = time.time()
+                self._finished.set()
+                close = getattr(self._iterable, 'close', None)
+                if close is not None:
+                    close()
+
+    def wait(self, timeout=None):
+        """Block until the task has finished; returns False on timeout"""
+        return self._finished.wait(timeout)
+
+class TaskQueue:
+    """A fixed pool of worker threads shared by every session of one server process.
+
+    submit() returns a queued BackgroundTask straight away; pollers use it
+    exactly like one started on its own thread. At most `workers` tasks run
+    at once, and at most `per_owner` of them for the same owner (an account
+    key), so one operator's long cleanup cannot take the whole pool. Free
+    workers take the oldest queued task of the next owner in turn, which
+    keeps the scheduling fair between operators with many queued tasks.
+    """
+
+    def __init__(self, workers=TASK_WORKERS, per_owner=TASKS_PER_OWNER):
+        self.workers = workers
+        self.per_owner = per_owner
+        self._queues = {}
+        self._running = {}
+        self._turns = deque()
+        self._condition = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._work, name=f"task-worker-{i}", daemon=True).start()
+
+    def submit(self, owner, iterable, name="task"):
+        """Queue iterable to be drained for owner and return its BackgroundTask"""
+        task = BackgroundTask(iterable, name, start=False)
+        with self._condition:
+            if owner not in self._queues:
+                self._queues[owner] = deque()
+                self._turns.append(owner)
+            self._queues[owner].append(task)
+            metrics.inc('tasks_submitted_total')
+            self._condition.notify()
+        return task
+
+    def position(self, task):
+        """Number of queued tasks of the same owner ahead of task (None once it has started)"""
+        with self._condition:
+            for queue in self._queues.values():
+                if task in queue:
+                    return list(queue).index(task)
+        return None
+
+    def stats(self):
+        """Running and queued task counts per owner"""
+        with self._condition:
+            return {
+                owner: {'running': self._running.get(owner, 0), 'queued': len(queue)}
+                for owner, queue in self._queues.items()
+            }
+
+    def _forget(self, owner):
+        """Drop an idle owner so the rotation only holds active ones"""
+        del self._queues[owner]
+        self._running.pop(owner, None)
+        self._turns.remove(owner)
+
+    def _next(self):
+        """Pop the next runnable task, rotating between owners; call with the condition held"""
+        for _ in range(len(self._turns)):
+            owner = self._turns.popleft()
+            queue = self._queues[owner]
+            while queue and queue[0].done:
+                # Cancelled while queued
+                queue.popleft()
+            if not queue and not self._running.get(owner):
+                del self._queues[owner]
+                self._running.pop(owner, None)
+                continue
+            self._turns.append(owner)
+            if queue and self._running.get(owner, 0) < self.per_owner:
+                return owner, queue.popleft()
+        return None, None
+
+    def _work(self):
+        while True:
+            with self._condition:
+                owner, task = self._next()
+                while task is None:
+                    self._condition.wait()
+                    owner, task = self._next()
+                self._running[owner] = self._running.get(owner, 0) + 1
+            metrics.observe('task_queue_wait_seconds', time.time() - task.created_at)
+            try:
+                task._run()
+            finally:
+                with self._condition:
+                    self._running[owner] -= 1
+                    if not self._running[owner] and not self._queues[owner]:
+                        self._forget(owner)
+                    self._condition.notify_all()
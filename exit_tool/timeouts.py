@@ -0,0 +1,175 @@
+"""Adaptive per-request deadlines, jittered retries and hedged requests"""
+import asyncio
+import random
+import threading
+import time
+
+from .config import (
+    RPC_HEDGE_RATIO, RPC_TIMEOUT_MAX_SECONDS, RPC_TIMEOUT_MIN_SECONDS, RPC_TIMEOUT_RETRIES, RPC_TIMEOUT_SECONDS
+)
+from .metrics import Histogram, metrics
+
+# Starting deadlines until enough latencies have been seen (the login flow's former fixed timeouts)
+INITIAL_TIMEOUTS = {
+    'connect': 10.0,
+    'GetStateRequest': 5.0,
+    'SendCodeRequest': 15.0,
+    'SignInRequest': 10.0,
+    'CheckPasswordRequest': 10.0,
+}
+
+# Read-only requests that may safely be sent twice; the first answer wins
+HEDGED_REQUESTS = frozenset({
+    'GetDialogsRequest', 'GetFullChannelRequest', 'GetFullChatRequest', 'ResolveUsernameRequest',
+    'GetChannelsRequest', 'GetChatsRequest', 'GetUsersRequest', 'GetStateRequest', 'GetPasswordRequest',
+})
+
+# Requests that are never repeated after a timeout: each one sends or spends a login code
+NO_RETRY_REQUESTS = frozenset({'SendCodeRequest', 'ResendCodeRequest', 'SignInRequest', 'CheckPasswordRequest'})
+
+class TimeoutPolicy:
+    """Per-request-type deadlines derived from the latencies seen so far.
+
+    Until min_samples answers of a type have arrived its deadline is the
+    initial one; after that it is multiplier x p99, kept within
+    [min_timeout, max_timeout], so slow networks get longer deadlines and
+    fast ones notice a stalled connection sooner. Timed-out requests are
+    retried up to `retries` times after a full-jitter exponential backoff.
+    Reads in `hedged` that are still unanswered at the p95 latency are sent
+    a second time, for at most hedge_ratio of all requests.
+    """
+
+    def __init__(self, default=RPC_TIMEOUT_SECONDS, min_timeout=RPC_TIMEOUT_MIN_SECONDS,
+                 max_timeout=RPC_TIMEOUT_MAX_SECONDS, multiplier=3.0, min_samples=20,
+                 retries=RPC_TIMEOUT_RETRIES, backoff=0.5, hedge_ratio=RPC_HEDGE_RATIO,
+                 initial=None, hedged=HEDGED_REQUESTS, no_retry=NO_RETRY_REQUESTS):
+        self.default = default
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.retries = retries
+        self.backoff = backoff
+        self.hedge_ratio = hedge_ratio
+        self.initial = INITIAL_TIMEOUTS if initial is None else initial
+        self.hedged = hedged
+        self.no_retry = no_retry
+        self._latencies = {}
+        self._requests = 0
+        self._hedges = 0
+        self._lock = threading.Lock()
+
+    def observe(self, name, seconds):
+        """Record the latency of a successful request"""
+        with self._lock:
+            histogram = self._latencies.get(name)
+            if histogram is None:
+                histogram = self._latencies[name] = Histogram()
+            histogram.observe(seconds)
+
+    def _quantile(self, name, q):
+        with self._lock:
+            histogram = self._latencies.get(name)
+            if histogram is None or histogram.count < self.min_samples:
+                return None
+            return histogram.quantile(q)
+
+    def timeout(self, name):
+        """Deadline in seconds for one attempt of a request"""
+        p99 = self._quantile(name, 0.99)
+        if p99 is None:
+            return self.initial.get(name, self.default)
+        return min(self.max_timeout, max(self.min_timeout, self.multiplier * p99))
+
+    def hedge_delay(self, name):
+        """Seconds after which a slow request is sent again, or None if it is never hedged"""
+        if name not in self.hedged:
+            return None
+        return self._quantile(name, 0.95)
+
+    def retries_for(self, name):
+        return 0 if name in self.no_retry else self.retries
+
+    def backoff_delay(self, retry):
+        """Full-jitter exponential backoff before the given retry (counting from 0)"""
+        return random.uniform(0, self.backoff * 2 ** retry)
+
+    def budget(self, name):
+        """Upper bound on one logical request: every attempt, reconnects and backoffs included"""
+        retries = self.retries_for(name)
+        return (
+            (retries + 1) * self.timeout(name)
+            + retries * (self.timeout('connect') + self.backoff * 2 ** retries)
+        )
+
+    def _count_request(self):
+        with self._lock:
+            self._requests += 1
+
+    def _take_hedge(self):
+        with self._lock:
+            if self._hedges >= self.hedge_ratio * self._requests:
+                return False
+            self._hedges += 1
+            return True
+
+# Shared by every account's scheduler and the login flow; latency is a property of the network
+timeout_policy = TimeoutPolicy()
+
+async def run_with_deadline(call, name, policy, spare_token=None):
+    """Await one attempt of call() within the policy's deadline, hedging slow reads.
+
+    A hedge is only sent when spare_token() grants a rate-limit token
+    without waiting, so hedging never pushes the account towards flood
+    waits. The first copy to finish wins and the other is cancelled.
+    Raises asyncio.TimeoutError when no copy answered in time, or when the
+    connection was dropped under every copy (Telethon cancels in-flight
+    requests when it disconnects).
+    """
+    policy._count_request()
+    deadline = time.monotonic() + policy.timeout(name)
+    tasks = [asyncio.ensure_future(call())]
+    pending = set(tasks)
+    try:
+        hedge_delay = policy.hedge_delay(name)
+        if hedge_delay is not None:
+            done, pending = await asyncio.wait(pending, timeout=hedge_delay)
+            if not done and (spare_token is None or spare_token()) and policy._take_hedge():
+                metrics.inc('rpc_hedges_total', rpc=name)
+                tasks.append(asyncio.ensure_future(call()))
+                pending.add(tasks[-1])
+            else:
+                pending |= done
+
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled():
+                    if task is not tasks[0]:
+                        metrics.inc('rpc_hedge_wins_total', rpc=name)
+                    return task.result()
+        raise asyncio.TimeoutError(f"{name} got no answer within {policy.timeout(name):.1f}s")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def connect_with_retries(client, policy=timeout_policy, purpose='client'):
+    """Connect client within the policy's connect deadline, retrying with jittered backoff"""
+    for retry in range(policy.retries + 1):
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(client.connect(), policy.timeout('connect'))
+        except (asyncio.TimeoutError, OSError) as e:
+            metrics.inc('connect_failures_total', purpose=purpose, error=type(e).__name__)
+            if retry == policy.retries:
+                raise
+            await client.disconnect()
+            await asyncio.sleep(policy.backoff_delay(retry))
+            continue
+        elapsed = time.monotonic() - started
+        policy.observe('connect', elapsed)
+        metrics.observe('connect_seconds', elapsed, purpose=purpose)
+        return
@@ -0,0 +1,127 @@
+"""In-memory n-gram index over normalized dialog titles for instant lookups"""
+from collections import Counter, defaultdict
+
+from .matching import normalize_title
+
+def _grams(text, n):
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+def substring_distance(pattern, text):
+    """Smallest edit distance between pattern and any substring of text.
+
+    Myers' bit-parallel variant of Sellers' algorithm: one pass over text
+    with a few integer operations per character, whatever the pattern length.
+    """
+    if not pattern:
+        return 0
+    peq = {}
+    for i, c in enumerate(pattern):
+        peq[c] = peq.get(c, 0) | (1 << i)
+    mask = (1 << len(pattern)) - 1
+    high = 1 << (len(pattern) - 1)
+    pv, mv = mask, 0
+    score = best = len(pattern)
+    for c in text:
+        eq = peq.get(c, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = (mv | ~(xh | pv)) & mask
+        mh = pv & xh
+        if ph & high:
+            score += 1
+        elif mh & high:
+            score -= 1
+            if score < best:
+                best = score
+        # A match may start anywhere in text, so the top row stays 0 (no carry into bit 0)
+        ph = (ph << 1) & mask
+        mh = (mh << 1) & mask
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv
+    return best
+
+class TitleIndex:
+    """Substring and approximate title search over a fixed list of DialogRecords.
+
+    Titles are folded with normalize_title, so look-alike characters,
+    fullwidth letters and emoji padding do not hide a match, and every
+    n-gram of each folded title is put in an inverted index. Exact queries
+    intersect the posting lists of the query's n-grams; approximate queries
+    rank titles by shared n-grams (a title within k edits still contains
+    all but k * n of the query's distinct n-grams) and verify the best
+    candidates; with a limit only the `limit` best-ranked candidates are
+    verified, so a limited lookup stays fast however many titles share a
+    single n-gram. Queries too short for that bound are searched with
+    fewer typos (see max_typos).
+    """
+
+    def __init__(self, records, n=3):
+        self.n = n
+        self.records = list(records)
+        self.titles = [normalize_title(record.title) for record in self.records]
+        postings = defaultdict(list)
+        for position, title in enumerate(self.titles):
+            for gram in _grams(title, n):
+                postings[gram].append(position)
+        self._postings = dict(postings)
+
+    def __len__(self):
+        return len(self.records)
+
+    def search(self, query, max_distance=0, limit=None):
+        """Return records whose folded title contains the folded query within max_distance edits"""
+        query = normalize_title(query)
+        if not query:
+            return []
+        if max_distance:
+            positions = self._approximate(query, max_distance, limit)
+        else:
+            positions = self._exact(query, limit)
+        return [self.records[position] for position in positions]
+
+    def _exact(self, query, limit):
+        if len(query) < self.n:
+            candidates = range(len(self.titles))
+        else:
+            lists = sorted((self._postings.get(gram, ()) for gram in _grams(query, self.n)), key=len)
+            if not lists[0]:
+                return []
+            candidate_set = set(lists[0])
+            for other in lists[1:]:
+                candidate_set.intersection_update(other)
+                if not candidate_set:
+                    return []
+            candidates = sorted(candidate_set)
+        matches = []
+        for position in candidates:
+            if query in self.titles[position]:
+                matches.append(position)
+                if limit and len(matches) >= limit:
+                    break
+        return matches
+
+    def max_typos(self, query):
+        """Most edits an approximate search for query can allow while its n-gram filter still works"""
+        return max(0, (len(_grams(normalize_title(query), self.n)) - 1) // self.n)
+
+    def _approximate(self, query, max_distance, limit):
+        grams = _grams(query, self.n)
+        # Each edit removes at most n of the query's distinct n-grams from a matching title. Queries
+        # too short to keep one get fewer typos instead of a scan of every title
+        max_distance = min(max_distance, self.max_typos(query))
+        if not max_distance:
+            return self._exact(query, limit)
+        required = len(grams) - max_distance * self.n
+        shared = Counter()
+        for gram in grams:
+            shared.update(self._postings.get(gram, ()))
+        # Titles sharing the most n-grams are the likeliest matches; with a limit only that many are verified
+        ranked = shared.most_common(limit) if limit else shared.most_common()
+        candidates = [position for position, count in ranked if count >= required]
+        matches = []
+        for position in candidates:
+            if substring_distance(query, self.titles[position]) <= max_distance:
+                matches.append(position)
+                if limit and len(matches) >= limit:
+                    break
+        return matches